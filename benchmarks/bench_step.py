@@ -0,0 +1,164 @@
+"""
+Benchmark the cost of a `Step` handler beyond the user function, per phase, against an
+in-memory storage with injected latency.
+
+    python benchmarks/bench_step.py                      # run and print
+    python benchmarks/bench_step.py --save               # store as benchmarks/baseline.json
+    python benchmarks/bench_step.py --compare            # fail on regression against the baseline
+
+Each scenario has N sources and a wildcard destination with M files (as in `tests/test_multi.py`).
+Phases: `prepare` (source downloads and destination paths), `execute` (writing the outputs),
+`upload` (saving destinations), `response` (building the returned body) and `handler` (end to end).
+"""
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from cloudpipe import MemoryStorage, Step  # noqa: E402
+from cloudpipe.main import EventFSMap, return_body  # noqa: E402
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+
+@dataclass
+class Scenario:
+    sources: int
+    outputs: int
+    latency: float = 0.002
+    workers: int = 1
+
+    @property
+    def name(self) -> str:
+        return f"{self.sources}src-{self.outputs}out-{self.latency * 1e3:g}ms-{self.workers}w"
+
+
+SCENARIOS = [
+    Scenario(sources=1, outputs=1, latency=0.0),
+    Scenario(sources=6, outputs=10),
+    Scenario(sources=6, outputs=10, workers=8),
+    Scenario(sources=6, outputs=200),
+    Scenario(sources=6, outputs=200, workers=8),
+]
+
+
+def setup(scenario: Scenario):
+    storage = MemoryStorage(f"bench-{scenario.name}", latency=scenario.latency)
+    for index in range(scenario.sources):
+        storage.put(f"in/{index}.jpeg", b"x" * 1024)
+
+    source = {f"src{index}": f"{{doc}}/src{index}.jpeg" for index in range(scenario.sources)}
+    destn = {"objects": "{doc}/output/*.jpeg", "summary": "{doc}/summary.json"}
+    event = {"document": {"name": "bench_doc"},
+             **{f"src{index}": {"key": f"in/{index}.jpeg"} for index in range(scenario.sources)}}
+    return storage, source, destn, event
+
+
+def write_outputs(objects: Path, summary: Path, count: int):
+    for index in range(count):
+        (objects / f"{index}.jpeg").write_bytes(b"y" * 1024)
+    summary.write_text("{}")
+
+
+def run_phases(scenario: Scenario, root: Path):
+    storage, source, destn, event = setup(scenario)
+    timings = {}
+
+    start = time.perf_counter()
+    fsmap = EventFSMap(event=event, source=source, destn=destn, root=root,
+                       downloader=storage.downloader, uploader=storage.uploader,
+                       max_download_workers=scenario.workers,
+                       max_upload_workers=scenario.workers)
+    paths, remotemap = fsmap.__enter__()
+    timings["prepare"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_outputs(paths["_save"]["objects"], paths["_save"]["summary"], scenario.outputs)
+    timings["execute"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fsmap.__exit__(None, None, None)
+    timings["upload"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    return_body(event=event, s3map=remotemap, list_keys=["objects"],
+                extra_return={"objects": {}, "summary": {}}, key_copy=["document"])
+    timings["response"] = time.perf_counter() - start
+    return timings
+
+
+def run_handler(scenario: Scenario):
+    storage, source, destn, event = setup(scenario)
+    step = Step(storage=storage, max_download_workers=scenario.workers,
+                max_upload_workers=scenario.workers)
+
+    @step(source=source, destn=destn, list_copy_keys=["document"])
+    def worker(objects: Path, summary: Path, **kwargs):
+        write_outputs(objects, summary, scenario.outputs)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    worker(event, None)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def benchmark(scenario: Scenario, repeat: int):
+    phases = {}
+    for _ in range(repeat):
+        root = Path(tempfile.mkdtemp())
+        try:
+            for phase, seconds in run_phases(scenario, root).items():
+                phases.setdefault(phase, []).append(seconds)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    handler = [run_handler(scenario) for _ in range(repeat)]
+    result = {phase: statistics.median(values) * 1e3 for phase, values in phases.items()}
+    result["handler"] = statistics.median(elapsed for elapsed, _ in handler) * 1e3
+    result["peak_kib"] = max(peak for _, peak in handler) / 1024
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", action="store_true", help=f"store results in {BASELINE.name}")
+    parser.add_argument("--compare", action="store_true", help=f"compare with {BASELINE.name}")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed relative slowdown of the handler, when comparing")
+    args = parser.parse_args()
+
+    baseline = json.loads(BASELINE.read_text()) if args.compare else {}
+    results, regressions = {}, []
+
+    columns = ["prepare", "execute", "upload", "response", "handler", "peak_kib"]
+    print(f"{'scenario (ms, KiB)':28}" + "".join(f"{c:>10}" for c in columns))
+    for scenario in SCENARIOS:
+        result = results[scenario.name] = benchmark(scenario, args.repeat)
+        print(f"{scenario.name:28}" + "".join(f"{result[c]:10.2f}" for c in columns))
+
+        if reference := baseline.get(scenario.name):
+            if result["handler"] > reference["handler"] * (1 + args.tolerance):
+                regressions.append(
+                    f"{scenario.name}: {result['handler']:.2f} ms vs baseline {reference['handler']:.2f} ms")
+
+    if args.save:
+        BASELINE.write_text(json.dumps(results, indent=2) + "\n")
+    for regression in regressions:
+        print("Regression:", regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Measure the cold start cost of cloudpipe: `import cloudpipe`, and defining a `Step` and decorating
+a handler with it. Each run uses a fresh interpreter.
+
+    python benchmarks/import_time.py --runs 20 --max-import-ms 150 --max-define-ms 20
+
+Exits with status 1 if a median exceeds its limit, or if boto3 was imported before the first transfer.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import cloudpipe
+imported = time.perf_counter()
+
+step = cloudpipe.Step(location_env_key={"s3": "benchmark_bucket"})
+
+@step(source={"upload": "{doc}.jpg"},
+      destn={"collage": "{doc}/collage.jpeg", "faces": "{doc}/faces/*"})
+def worker(upload, collage, faces, **kwargs):
+    pass
+
+defined = time.perf_counter()
+print(json.dumps(dict(import_ms=(imported - start) * 1e3, define_ms=(defined - imported) * 1e3,
+                      boto3_imported="boto3" in sys.modules)))
+"""
+
+
+def probe() -> dict:
+    root = Path(__file__).resolve().parents[1]
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=root, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-define-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    define_ms = statistics.median(r["define_ms"] for r in results)
+    boto3_imported = any(r["boto3_imported"] for r in results)
+
+    print(f"import cloudpipe: {import_ms:8.2f} ms (median of {args.runs})")
+    print(f"define step:      {define_ms:8.2f} ms (median of {args.runs})")
+    print(f"boto3 imported:   {boto3_imported}")
+
+    failed = boto3_imported
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failed = True
+    if args.max_define_ms is not None and define_ms > args.max_define_ms:
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
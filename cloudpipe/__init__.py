@@ -1 +1,6 @@
+from .cache import DownloadCache
+from .local import LocalStorage, MemoryStorage
+from .metrics import EMFExporter, MemoryCollector
+from .pipeline import Pipeline
+from .retry import RetryPolicy
 from .step_define import Step
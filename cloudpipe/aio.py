@@ -0,0 +1,145 @@
+import asyncio
+import functools
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from .main import EventFSMap, _file_size
+from .metrics import phase
+from .types import *
+
+T = TypeVar("T")
+
+
+def to_async(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """Run a blocking callable (e.g. a `Downloader`) in the default executor of the running loop"""
+
+    @functools.wraps(func)
+    async def call(*args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(func, *args, **kwargs))
+    return call
+
+
+async def gather_transfers(jobs: Sequence[Callable[[], Awaitable[T]]], limit: int = 64) -> List[T]:
+    """Await transfer `jobs` concurrently, at most `limit` at once, returning their results in
+    the order given. The first failing job cancels the others and its exception is re-raised."""
+
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def bounded(job):
+        async with semaphore:
+            return await job()
+
+    tasks = [asyncio.ensure_future(bounded(job)) for job in jobs]
+    if not tasks:
+        return []
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    if pending:
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending)
+    for task in tasks:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+@dataclass
+class AsyncEventFSMap(EventFSMap):
+    """
+    `EventFSMap` used with `async with`, awaiting concurrent downloads and uploads.
+
+    Transfers use `async_downloader` and `async_uploader` when provided, otherwise the blocking
+    `downloader` and `uploader` run in the default executor of the loop.
+    """
+
+    async_downloader: Optional[AsyncDownloader] = None
+    async_uploader: Optional[AsyncUploader] = None
+
+    arg_override_async_downloader: Dict[str, AsyncDownloader] = \
+        field(default_factory=dict)
+
+    max_concurrency: int = 64
+    "Transfers in flight at once"
+
+    downloads: List[Tuple[str, Dict[str, str]]] = field(init=False)
+
+    def __post_init__(self) -> None:
+        # transfers are awaited in `__aenter__`
+        self.downloads = self.prepare_sources()
+
+    async def __aenter__(self) -> Tuple[Dict[str, Path], Dict[str, str]]:
+        with phase(self.metrics, "download"):
+            await gather_transfers([functools.partial(self.async_download_source, source_name, s3_args)
+                                    for source_name, s3_args in self.downloads],
+                                   limit=self.max_concurrency)
+
+        self.locate_sources(
+            self.downloads, lambda source_name, s3_args: Path(s3_args['Filename']))
+
+        self.prepare_destn()
+        return self.source_locations, self.current_names
+
+    async def __aexit__(self,
+                        exc_type: Optional[Type[BaseException]],
+                        exc_val: Optional[BaseException],
+                        exc_tb) -> None:
+
+        if not exc_type:
+            with phase(self.metrics, "upload"):
+                _, uploads = self.collect_destn()
+                uploaded = await gather_transfers([functools.partial(self.async_upload_destn, key, s3_args)
+                                                   for key, s3_args in uploads],
+                                                  limit=self.max_concurrency)
+                self.record_uploads(uploads, uploaded)
+
+    def __enter__(self):
+        raise TypeError(f"{type(self).__name__} must be used with `async with`")
+
+    async def async_download_source(self, source_name: str, s3_args: Dict[str, str]) -> None:
+        if source_name in self.arg_override_async_downloader:
+            downloader = self.arg_override_async_downloader[source_name]
+        elif source_name in self.arg_override_downloader:
+            # only a blocking downloader is known for this source
+            downloader = None
+        else:
+            downloader = self.async_downloader
+        if downloader is None or self.download_cache or self.fused_outputs or \
+                s3_args['Filename'] in self.source_codecs:
+            return await to_async(self.download_source)(source_name, s3_args)
+
+        start = time.perf_counter()
+        try:
+            await downloader(**s3_args)
+        except DownloadError as exc:
+            raise self.download_error(source_name, s3_args, exc)
+        if source_name not in self.fetched:
+            self.fetched.append(source_name)
+        if self.metrics:
+            self.metrics.transfer("download", source_name, s3_args['Key'],
+                                  _file_size(s3_args['Filename']), time.perf_counter() - start)
+
+    async def async_upload_destn(self, key: str, s3_args: Dict[str, str]) -> bool:
+        if self.async_uploader is None or self.fused_outputs or self.content_hash or \
+                key in self.destn_codecs:
+            return await to_async(self.upload_destn)(key, s3_args)
+
+        start = time.perf_counter()
+        try:
+            await self.async_uploader(**s3_args)
+        except FileNotFoundError:
+            if key not in self.ignore_missing_destn:
+                raise
+            return False
+        if self.metrics:
+            self.metrics.transfer("upload", key, s3_args['Key'],
+                                  _file_size(s3_args['Filename']), time.perf_counter() - start)
+        return True
+
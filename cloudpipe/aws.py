@@ -1,24 +1,62 @@
+import importlib.util
+import io
 import os
+import threading
 from dataclasses import dataclass, field
 
+from .multipart import SHA256_METADATA, LargeObjectTransfer
 from .types import *
 
-available = True
-try:
-    import boto3
-except ModuleNotFoundError as args:
-    available = False
+# boto3 is only imported once a client is needed, as importing it takes a
+# significant part of a cold start
+available = importlib.util.find_spec("boto3") is not None
+
+
+MAX_POOL_CONNECTIONS = 50
+"Connection pool size of the shared S3 clients (boto3 defaults to 10)"
+
+_clients: Dict[Tuple[Optional[str], int], Any] = {}
+_clients_lock = threading.Lock()
 
 
 def is_current() -> bool:
     return bool(os.environ.get("AWS_LAMBDA_FUNCTION_VERSION"))
 
 
+def shared_client(region: Optional[str] = None,
+                  max_pool_connections: int = MAX_POOL_CONNECTIONS) -> Any:
+    """S3 client shared by all storages of the process with the same region and pool size"""
+    key = (region, max_pool_connections)
+    with _clients_lock:
+        if (client := _clients.get(key)) is None:
+            import boto3
+            from botocore.config import Config
+
+            client = _clients[key] = boto3.session.Session().client(
+                "s3", region_name=region,
+                config=Config(max_pool_connections=max_pool_connections))
+    return client
+
+
 @dataclass
 class Storage:
     location_env_key: str
     bucket: str = field(default="")
-    s3: Any = field(init=False)
+
+    region: Optional[str] = None
+    max_pool_connections: int = MAX_POOL_CONNECTIONS
+
+    transfer_config: Dict[str, Any] = field(default_factory=dict)
+    """Arguments of `boto3.s3.transfer.TransferConfig`,
+    e.g. multipart_threshold, multipart_chunksize, max_concurrency"""
+
+    large_objects: Dict[str, Any] = field(default_factory=dict)
+    """Arguments of `LargeObjectTransfer` (e.g. threshold, part_size, checksum), for resumable
+    and checksummed transfers of large objects. Not used if empty."""
+
+    _client: Any = field(default=None, init=False, repr=False)
+    _transfer: Any = field(default=None, init=False, repr=False)
+    _large: Optional[LargeObjectTransfer] = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
         assert available, "Please install boto3 for AWS: `python -m pip install boto3`"
@@ -27,10 +65,209 @@ class Storage:
                 self.bucket = os.environ[self.location_env_key]
             except KeyError:
                 self.bucket = self.location_env_key
-        self.s3 = boto3.resource("s3").Bucket(self.bucket)
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = shared_client(region=self.region,
+                                         max_pool_connections=self.max_pool_connections)
+        return self._client
+
+    @property
+    def transfer(self) -> Any:
+        if self._transfer is None:
+            from boto3.s3.transfer import TransferConfig
+
+            self._transfer = TransferConfig(**self.transfer_config)
+        return self._transfer
+
+    @property
+    def large(self) -> Optional[LargeObjectTransfer]:
+        if self._large is None and self.large_objects:
+            self._large = LargeObjectTransfer(client=self.client, bucket=self.bucket,
+                                              **self.large_objects)
+        return self._large
 
     def downloader(self, Key: str, Filename: str):
-        self.s3.download_file(Key=Key, Filename=Filename)
+        if (large := self.large) and \
+                self.client.head_object(Bucket=self.bucket, Key=Key)["ContentLength"] >= large.threshold:
+            large.download(Key=Key, Filename=Filename)
+            return
+        self.client.download_file(Bucket=self.bucket, Key=Key, Filename=Filename,
+                                  Config=self.transfer)
+
+    def uploader(self, Key: str, Filename: str, Sha256: Optional[str] = None,
+                 ContentType: Optional[str] = None):
+        if (large := self.large) and os.path.getsize(Filename) >= large.threshold:
+            large.upload(Key=Key, Filename=Filename, Sha256=Sha256,
+                         ContentType=ContentType)
+            return
+        extra = {}
+        if Sha256:
+            extra["Metadata"] = {SHA256_METADATA: Sha256}
+        if ContentType:
+            extra["ContentType"] = ContentType
+        self.client.upload_file(Bucket=self.bucket, Key=Key, Filename=Filename,
+                                Config=self.transfer, ExtraArgs=extra or None)
+
+    def delete(self, Key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=Key)
+
+    def content_hash(self, Key: str) -> Optional[str]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=Key)
+        except self.client.exceptions.ClientError:
+            return None
+        return head.get("Metadata", {}).get(SHA256_METADATA)
+
+    def object_size(self, Key: str) -> Optional[int]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=Key)
+        except self.client.exceptions.ClientError:
+            return None
+        return head["ContentLength"]
+
+    def fingerprint(self, Key: str) -> Optional[str]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=Key)
+        except self.client.exceptions.ClientError:
+            return None
+        return f"{self.bucket}/{Key}@{head['ETag']}:{head.get('VersionId', '')}"
+
+    def list_keys(self, Prefix: str) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=Prefix,
+                                       PaginationConfig={"PageSize": 1000}):
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+    def open_reader(self, Key: str) -> BinaryIO:
+        return io.BufferedReader(RangedReader(client=self.client, bucket=self.bucket, key=Key),
+                                 buffer_size=STREAM_CHUNK_SIZE)
+
+    def open_writer(self, Key: str) -> BinaryIO:
+        return MultipartWriter(client=self.client, bucket=self.bucket, key=Key)
+
+
+STREAM_CHUNK_SIZE = 8 * 2 ** 20
+"Size of ranged GETs, and of multipart upload parts (at least 5 MiB for S3)"
+
+
+class RangedReader(io.RawIOBase):
+    """Seekable read-only stream of an S3 object, fetched lazily with ranged GETs"""
+
+    def __init__(self, client: Any, bucket: str, key: str):
+        self.client, self.bucket, self.key = client, bucket, key
+        self.position = 0
+        self._size: Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = self.client.head_object(
+                Bucket=self.bucket, Key=self.key)["ContentLength"]
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readall(self) -> bytes:
+        # in large ranges, rather than the default small reads
+        chunks = []
+        while data := self.read(STREAM_CHUNK_SIZE):
+            chunks.append(data)
+        return b"".join(chunks)
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={self.position}-{end - 1}")
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class MultipartWriter(io.RawIOBase):
+    """Write-only stream to an S3 object, uploaded in parts as data is written.
+
+    The object is committed on `close`, or discarded with `abort`.
+    Objects smaller than one part are uploaded with a single PUT.
+    """
+
+    def __init__(self, client: Any, bucket: str, key: str,
+                 part_size: int = STREAM_CHUNK_SIZE):
+        self.client, self.bucket, self.key = client, bucket, key
+        self.part_size = part_size
+        self.position = 0
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict[str, Any]] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key,
+                                       Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts})
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    def abort(self) -> None:
+        if self._upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+        super().close()
 
-    def uploader(self, Key: str, Filename: str):
-        self.s3.upload_file(Key=Key, Filename=Filename)
+    def _upload_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self._parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            PartNumber=number, Body=data)
+        self._parts.append({"PartNumber": number, "ETag": response["ETag"]})
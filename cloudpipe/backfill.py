@@ -0,0 +1,264 @@
+"""
+Run a decorated handler over many events on this machine, across a pool of processes.
+
+    python -m cloudpipe.backfill my_module:handler --events events.jsonl --output results.jsonl
+    python -m cloudpipe.backfill my_module:handler --prefix pages/ --source original
+
+Events are read from a JSON Lines file, or generated from the objects listed under a prefix
+(`{"document": {"name": <file stem>}, <source>: {"key": <key>}}`). Each response is appended
+to `output` and each failure to `failures`, flushed as they complete. Rerunning with the same
+files resumes, skipping the events already recorded there (by a digest of each event, so that
+objects added to or removed from the prefix in the meantime do not matter).
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set, TextIO, Tuple
+
+from .cache import DownloadCache
+from .memo import event_digest
+from .types import *
+from .workspace import Workspace
+
+
+def read_events(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path) as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def events_from_keys(lister: Lister, prefix: str, source: str) -> Iterator[Dict[str, Any]]:
+    """One event per object under `prefix`, passed as `source`"""
+    for key in lister(Prefix=prefix):
+        yield {"document": {"name": PurePosixPath(key).stem}, source: {"key": key}}
+
+
+def completed(*paths: Optional[Path]) -> Set[str]:
+    """Digest (see `event_digest`) of the events recorded in the JSON Lines `paths`"""
+    done = set()
+    for path in paths:
+        if path and path.exists():
+            with open(path) as fp:
+                for line in fp:
+                    try:
+                        done.add(json.loads(line)["event_digest"])
+                    except (ValueError, KeyError):
+                        # line cut short by an interrupted run
+                        continue
+    return done
+
+
+@dataclass
+class Backfill:
+    """
+    Run `handler` (produced by `Step.__call__`) over events, in `workers` processes.
+
+    Each worker gets its own workspace (and download cache, if the step has one) under `workdir`,
+    rather than the `local` path of the step.
+    """
+
+    handler: HANDLER
+
+    output: Path
+    "Responses, as JSON Lines `{\"index\": ..., \"event_digest\": ..., \"response\": ...}`"
+
+    failures: Optional[Path] = None
+    """Failures, as JSON Lines `{\"index\": ..., \"event_digest\": ..., \"event\": ..., \"error\": ...}`.
+    Written to `output` if None."""
+
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+
+    retry_failures: bool = False
+    "On resume, run again the events which failed"
+
+    workdir: Optional[Path] = None
+    "Directory for the workspaces of workers, a temporary directory if None"
+
+    report_every: float = 10.0
+    "Seconds between throughput reports"
+
+    report: TextIO = sys.stderr
+
+    def __call__(self, events: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        done = completed(self.output) if self.retry_failures else \
+            completed(self.output, self.failures)
+
+        workdir = Path(tempfile.mkdtemp(prefix="cloudpipe-backfill-", dir=self.workdir))
+        stats = dict(processed=0, failed=0, skipped=0)
+        start = last_report = time.perf_counter()
+        lock = threading.Lock()
+        # of the events in progress, taken before the handler sees them
+        digests: Dict[int, str] = {}
+
+        def iter_pending() -> Iterator[Tuple[int, Dict[str, Any]]]:
+            # by digest rather than position, as a listing may have changed since the previous run
+            for index, event in enumerate(events):
+                digest = event_digest(event)
+                with lock:
+                    if digest in done:
+                        stats["skipped"] += 1
+                        continue
+                    digests[index] = digest
+                yield index, event
+
+        pending = iter_pending()
+
+        with open(self.output, "a") as output, \
+                (open(self.failures, "a") if self.failures else contextlib.nullcontext(output)) as failures:
+
+            def record(result: Tuple[int, Dict[str, Any], Optional[Dict[str, Any]], Optional[str]]):
+                nonlocal last_report
+                index, event, response, error = result
+                with lock:
+                    digest = digests.pop(index)
+                    if error is None:
+                        stats["processed"] += 1
+                        output.write(json.dumps(dict(index=index, event_digest=digest,
+                                                     response=response), default=str) + "\n")
+                        output.flush()
+                    else:
+                        stats["failed"] += 1
+                        failures.write(json.dumps(dict(index=index, event_digest=digest,
+                                                       event=event, error=error), default=str) + "\n")
+                        failures.flush()
+                    if (now := time.perf_counter()) - last_report >= self.report_every:
+                        last_report = now
+                        self.print_report(stats, now - start)
+
+            try:
+                if self.workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+                    _init_worker(self.handler, workdir, isolate=False)
+                    for item in pending:
+                        record(_run_event(item))
+                else:
+                    self.run_pool(pending, workdir, record)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["per_second"] = (stats["processed"] + stats["failed"]) / max(stats["seconds"], 1e-9)
+        self.print_report(stats, stats["seconds"])
+        return stats
+
+    def run_pool(self, pending, workdir: Path, record: Callable) -> None:
+        # forked, so that the handler and its step are inherited rather than pickled
+        context = multiprocessing.get_context("fork")
+        # bounded, as the pool would otherwise queue every event at once
+        slots = threading.BoundedSemaphore(self.workers * 4)
+        errors = []
+
+        def on_result(result):
+            try:
+                record(result)
+            finally:
+                slots.release()
+
+        def on_error(exc):
+            errors.append(exc)
+            slots.release()
+
+        with context.Pool(self.workers, initializer=_init_worker,
+                          initargs=(self.handler, workdir)) as pool:
+            for item in pending:
+                slots.acquire()
+                if errors:
+                    break
+                pool.apply_async(_run_event, (item,), callback=on_result,
+                                 error_callback=on_error)
+            pool.close()
+            pool.join()
+        if errors:
+            raise errors[0]
+
+    def print_report(self, stats: Dict[str, Any], seconds: float) -> None:
+        count = stats["processed"] + stats["failed"]
+        print(f"{stats['processed']} processed, {stats['failed']} failed, {stats['skipped']} skipped "
+              f"in {seconds:.1f}s ({count / max(seconds, 1e-9):.1f} events/s)",
+              file=self.report, flush=True)
+
+
+_handler: Optional[HANDLER] = None
+
+
+def _init_worker(handler: HANDLER, workdir: Path, isolate: bool = True) -> None:
+    global _handler
+
+    if isolate and (step := getattr(handler, "step", None)) is not None:
+        root = Path(tempfile.mkdtemp(prefix="worker-", dir=workdir))
+        if step.download_cache:
+            step.download_cache = DownloadCache(root=root / "cache",
+                                                max_bytes=step.download_cache.max_bytes)
+        step.workspace = Workspace(root=root / "work", disk_budget=step.workspace.disk_budget,
+                                   cache=step.download_cache)
+        step.local = None
+
+    # batch handlers expose the handler of a single event
+    _handler = getattr(handler, "single", handler)
+
+
+def _run_event(item: Tuple[int, Dict[str, Any]]):
+    index, event = item
+    try:
+        response = _handler(event, None)
+        if inspect.isawaitable(response):
+            response = asyncio.run(response)
+        return index, event, response, None
+    except Exception:
+        return index, event, None, traceback.format_exc()
+
+
+def load_handler(spec: str) -> HANDLER:
+    """Handler given as `module:attribute`"""
+    module, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module), attribute or "handler")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("handler", help="decorated handler, as module:attribute")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--events", type=Path, help="JSON Lines file of events")
+    source.add_argument("--prefix", help="generate an event per object under this prefix")
+    parser.add_argument("--source", help="argument receiving the object, with --prefix")
+    parser.add_argument("--output", type=Path, default=Path("results.jsonl"))
+    parser.add_argument("--failures", type=Path, default=Path("failures.jsonl"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--retry-failures", action="store_true")
+    parser.add_argument("--workdir", type=Path)
+    parser.add_argument("--report-every", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.getcwd())
+    handler = load_handler(args.handler)
+
+    if args.events:
+        events = read_events(args.events)
+    else:
+        if not args.source:
+            parser.error("--source is required with --prefix")
+        if not (lister := getattr(getattr(handler, "step", None), "lister", None)):
+            parser.error("the storage of the handler cannot list objects")
+        events = events_from_keys(lister, args.prefix, args.source)
+
+    stats = Backfill(handler, output=args.output, failures=args.failures, workers=args.workers,
+                     retry_failures=args.retry_failures, workdir=args.workdir,
+                     report_every=args.report_every)(events)
+    sys.exit(1 if stats["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .types import *
+
+
+def iter_batch(event: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Tuple[str, Union[str, Dict[str, Any]]]]:
+    """
+    Split a batch event into (item identifier, item event) pairs.
+
+    Supports SQS events (`Records`, JSON message bodies), Step Functions Map item batches
+    (`Items`, with `BatchInput` merged into each item) and plain lists of events.
+    SQS bodies are returned as is, to be parsed with each item.
+    """
+    if isinstance(event, list):
+        return [(str(index), item) for index, item in enumerate(event)]
+
+    if "Records" in event:
+        return [(record["messageId"], record["body"]) for record in event["Records"]]
+
+    if "Items" in event:
+        common = event.get("BatchInput") or {}
+        return [(str(index), {**common, **item}) for index, item in enumerate(event["Items"])]
+
+    raise ValueError(
+        "Batch event must be a list, or have `Records` (SQS) or `Items` (Step Functions)")
+
+
+def run_batch(handler: HANDLER, event: Union[Dict[str, Any], List[Dict[str, Any]]], context: Any,
+              max_workers: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Run `handler` for each item of a batch event.
+
+    Failing items do not stop the batch, they are reported in `batchItemFailures`
+    (the SQS partial batch response) and with their error in `results`.
+    """
+    items = iter_batch(event)
+
+    def run_item(item: Tuple[str, Union[str, Dict[str, Any]]]) -> Tuple[Dict[str, Any], Optional[Dict[str, str]]]:
+        identifier, item_event = item
+        try:
+            if isinstance(item_event, str):
+                # a malformed message fails its item only
+                item_event = json.loads(item_event)
+            response = handler(item_event, context)
+        except Exception as exc:
+            return (dict(itemIdentifier=identifier, statusCode='500', error=repr(exc)),
+                    dict(itemIdentifier=identifier))
+        return dict(response, itemIdentifier=identifier), None
+
+    if max_workers > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+            outcomes = list(pool.map(run_item, items))
+    else:
+        outcomes = [run_item(item) for item in items]
+
+    return {
+        'batchItemFailures': [failure for _, failure in outcomes if failure],
+        'results': [result for result, _ in outcomes],
+    }
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Tuple
+
+from .files import file_signature, link_or_copy
+from .types import *
+
+
+@dataclass
+class DownloadCache:
+    """
+    Size bounded LRU cache of downloaded files, kept on disk between invocations of a warm container.
+
+    Entries are keyed by the storage fingerprint of the key (bucket, key and ETag/version),
+    and are materialized into the invocation root by hard link, falling back to a copy.
+    A cached file modified in place by a step function is detected and discarded.
+    """
+
+    root: Path = field(default_factory=lambda: Path(
+        tempfile.gettempdir()) / "cloudpipe-cache")
+    """Directory holding the cached files"""
+
+    max_bytes: int = 512 * 2 ** 20
+    """Total size of cached files, least recently used files are evicted beyond this"""
+
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+
+    _entries: "OrderedDict[str, Tuple[int, int]]" = field(
+        default_factory=OrderedDict, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        self.root = Path(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # adopt files left by a previous cache in this container
+        existing = sorted((path.stat().st_atime, path)
+                          for path in self.root.iterdir()
+                          if path.is_file() and not path.suffix)
+        for _, path in existing:
+            if (signature := file_signature(path)) is not None:
+                self._entries[path.name] = signature
+        self.trim(self.max_bytes)
+
+    @property
+    def size(self) -> int:
+        return sum(size for size, _ in self._entries.values())
+
+    def fetch(self, downloader: Downloader, fingerprint: Fingerprint,
+              Key: str, Filename: str) -> bool:
+        """Download `Key` to `Filename` through the cache, True if found in the cache"""
+
+        tag = fingerprint(Key)
+        if tag is None:
+            downloader(Key=Key, Filename=Filename)
+            return False
+
+        name = hashlib.sha256(tag.encode()).hexdigest()
+        cached = self.root / name
+
+        with self._lock:
+            signature = self._entries.get(name)
+            if signature is not None:
+                self._entries.move_to_end(name)
+
+        if signature is not None:
+            try:
+                if file_signature(cached) != signature:
+                    raise FileNotFoundError(cached)
+                link_or_copy(cached, Path(Filename))
+            except FileNotFoundError:
+                self._discard(name)
+            else:
+                with self._lock:
+                    self.hits += 1
+                return True
+
+        with self._lock:
+            self.misses += 1
+        downloader(Key=Key, Filename=Filename)
+        self._add(name, Path(Filename))
+        return False
+
+    def trim(self, max_bytes: int) -> None:
+        """Evict least recently used files until the cache fits in `max_bytes`"""
+        with self._lock:
+            total = self.size
+            while self._entries and total > max_bytes:
+                name, (size, _) = self._entries.popitem(last=False)
+                (self.root / name).unlink(missing_ok=True)
+                total -= size
+
+    def clear(self) -> None:
+        self.trim(0)
+
+    def _add(self, name: str, path: Path) -> None:
+        cached = self.root / name
+        partial = self.root / f"{name}.{threading.get_ident()}.tmp"
+        try:
+            link_or_copy(path, partial)
+            os.replace(partial, cached)
+            if (signature := file_signature(cached)) is None:
+                raise FileNotFoundError(cached)
+        except OSError:
+            partial.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._entries[name] = signature
+            self._entries.move_to_end(name)
+        self.trim(self.max_bytes)
+
+    def _discard(self, name: str) -> None:
+        with self._lock:
+            self._entries.pop(name, None)
+            (self.root / name).unlink(missing_ok=True)
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import importlib.util
+import io
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from .types import *
+
+CHUNK_SIZE = 2 ** 20
+"Bytes copied at once, so that memory stays flat for large files"
+
+zstd_available = importlib.util.find_spec("zstandard") is not None
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+
+    suffix: str
+    "Appended to the keys of compressed objects"
+
+    content_type: str
+    """`Content-Type` of compressed objects. `Content-Encoding` is not set, so that clients
+    (and HTTP libraries) do not decompress them transparently, which the suffix would belie."""
+
+    writer: Callable[[BinaryIO], BinaryIO]
+    "Compressing stream over a writable binary file"
+
+    reader: Callable[[BinaryIO], BinaryIO]
+    "Decompressing stream over a readable binary file"
+
+
+def _zstd_writer(fp: BinaryIO) -> BinaryIO:
+    import zstandard
+    return zstandard.ZstdCompressor().stream_writer(fp, closefd=False)
+
+
+def _zstd_reader(fp: BinaryIO) -> BinaryIO:
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(fp, closefd=False)
+
+
+CODECS = {
+    # no name and mtime=0, so that identical content gives identical objects (see `Step.dedup_uploads`)
+    "gzip": Codec("gzip", ".gz", "application/gzip",
+                  writer=lambda fp: gzip.GzipFile(filename="", fileobj=fp, mode="wb", mtime=0),
+                  reader=lambda fp: gzip.GzipFile(fileobj=fp, mode="rb")),
+    "zstd": Codec("zstd", ".zst", "application/zstd", writer=_zstd_writer, reader=_zstd_reader),
+}
+"Codecs by name, `none` (or None) meaning no compression"
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    if name in (None, "none"):
+        return None
+    try:
+        codec = CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown codec {name!r}, expected one of {['none', *CODECS]}") from None
+    if codec.name == "zstd" and not zstd_available:
+        raise ValueError("The zstd codec requires the `zstandard` package")
+    return codec
+
+
+def codec_from_key(key: str) -> Optional[Codec]:
+    """Codec given by the suffix of `key`, if any"""
+    for codec in CODECS.values():
+        if key.endswith(codec.suffix):
+            return get_codec(codec.name)
+    return None
+
+
+class _HashingWriter(io.RawIOBase):
+    """Writable binary file computing the SHA256 of what is written through it"""
+
+    def __init__(self, fp: BinaryIO):
+        super().__init__()
+        self.fp, self.digest = fp, hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        return self.fp.write(data)
+
+
+def compress_file(codec: Codec, source: Union[str, Path], destn: Union[str, Path]) -> str:
+    """Compress `source` into `destn`, returning the SHA256 (hex) of the compressed content"""
+    with open(source, "rb") as src, open(destn, "wb") as raw:
+        hashing = _HashingWriter(raw)
+        with codec.writer(hashing) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    return hashing.digest.hexdigest()
+
+
+def decompress_file(codec: Codec, source: Union[str, Path], destn: Union[str, Path]) -> None:
+    with open(source, "rb") as raw, codec.reader(raw) as src, open(destn, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
@@ -0,0 +1,28 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+Signature = Tuple[int, int]
+"Size and modification time (ns) of a file, identifying its content between two checks"
+
+
+def file_signature(path: Union[str, Path]) -> Optional[Signature]:
+    """Signature of the file at `path`, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def link_or_copy(source: Path, destn: Path) -> None:
+    """Hard link `source` as `destn` (replaced if it exists), or copy it where links fail"""
+    destn.unlink(missing_ok=True)
+    try:
+        os.link(source, destn)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # e.g. different file systems
+        shutil.copyfile(source, destn)
@@ -2,17 +2,26 @@ from typing import Optional
 
 from .aws import is_current as aws_current
 from .aws import Storage as S3Storage
+from .local import LocalStorage, MemoryStorage
 from .types import *
 
 
 def new_storage(location_env_key: CLOUD_STORE,
-                assume_aws: str = None) -> Optional[CloudStoreBase]:
+                assume_aws: str = None, **options) -> Optional[CloudStoreBase]:
+
+    if directory := location_env_key.get("local"):
+        print("Using local directory storage")
+        return LocalStorage(location_env_key=directory)
+
+    if name := location_env_key.get("memory"):
+        print("Using in-memory storage")
+        return MemoryStorage(location_env_key=name)
 
     if assume_aws or aws_current():
         if aws_current():
             print("Running within AWS Lambda")
         print("Using AWS S3 storage")
-        return S3Storage(location_env_key=location_env_key["s3"])
+        return S3Storage(location_env_key=location_env_key["s3"], **options)
 
 
 def in_cloud():
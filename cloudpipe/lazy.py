@@ -0,0 +1,62 @@
+import os
+import threading
+from pathlib import Path, PurePath
+from typing import Any, Callable
+
+
+class LazyPath(os.PathLike):
+    """
+    Local path of a source which is only downloaded when the file is first accessed,
+    e.g. with `open`, `read_bytes`, `exists`, `str` or `os.fspath`.
+
+    Pure path attributes (`name`, `suffix`, `parent`, ...) do not download the file.
+    """
+
+    def __init__(self, path: Path, fetch: Callable[[], None]):
+        self._path = Path(path)
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self.fetched = False
+
+    def fetch(self) -> Path:
+        with self._lock:
+            if not self.fetched:
+                self._fetch()
+                self.fetched = True
+        return self._path
+
+    def __fspath__(self) -> str:
+        return str(self.fetch())
+
+    def __str__(self) -> str:
+        return str(self.fetch())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({str(self._path)!r}, fetched={self.fetched})"
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LazyPath):
+            other = other._path
+        return self._path == other
+
+    def __hash__(self) -> int:
+        return hash(self._path)
+
+    def open(self, *args, **kwargs):
+        return self.fetch().open(*args, **kwargs)
+
+    def read_bytes(self) -> bytes:
+        return self.fetch().read_bytes()
+
+    def read_text(self, *args, **kwargs) -> str:
+        return self.fetch().read_text(*args, **kwargs)
+
+    def exists(self) -> bool:
+        return self.fetch().exists()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if hasattr(PurePath, name):
+            return getattr(self._path, name)
+        return getattr(self.fetch(), name)
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from .files import link_or_copy
+from .multipart import file_sha256
+from .types import *
+
+
+@dataclass
+class LocalStorage:
+    """Storage in a local directory, keys being paths relative to it"""
+
+    location_env_key: str
+    """Environment variable containing the directory. If not found it will directly be used as the directory."""
+
+    root: Path = field(default=None)
+
+    link: bool = False
+    """Hard link files instead of copying them. Downloaded files then share their content with
+    the stored object, so must not be modified in place."""
+
+    def __post_init__(self):
+        if self.root is None:
+            self.root = Path(os.environ.get(
+                self.location_env_key, self.location_env_key))
+        self.root = Path(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def downloader(self, Key: str, Filename: str):
+        stored = self.root / Key
+        if not stored.is_file():
+            raise DownloadError(f"{Key} not found in {self.root}")
+        self._transfer(stored, Path(Filename))
+
+    def uploader(self, Key: str, Filename: str, Sha256: Optional[str] = None,
+                 ContentType: Optional[str] = None):
+        stored = self.root / Key
+        stored.parent.mkdir(parents=True, exist_ok=True)
+        self._transfer(Path(Filename), stored)
+
+    def delete(self, Key: str) -> None:
+        (self.root / Key).unlink(missing_ok=True)
+
+    def content_hash(self, Key: str) -> Optional[str]:
+        try:
+            return file_sha256(self.root / Key)
+        except FileNotFoundError:
+            return None
+
+    def object_size(self, Key: str) -> Optional[int]:
+        try:
+            return (self.root / Key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def fingerprint(self, Key: str) -> Optional[str]:
+        try:
+            stat = (self.root / Key).stat()
+        except FileNotFoundError:
+            return None
+        return f"{self.root}/{Key}@{stat.st_size}:{stat.st_mtime_ns}"
+
+    def list_keys(self, Prefix: str) -> Iterator[str]:
+        # the prefix may end within a file or directory name
+        parent = self.root / Prefix.rpartition("/")[0]
+        if not parent.is_dir():
+            return
+        keys = (path.relative_to(self.root).as_posix()
+                for path in parent.rglob("*") if path.is_file())
+        yield from sorted(key for key in keys if key.startswith(Prefix))
+
+    def open_reader(self, Key: str) -> BinaryIO:
+        with open(self.root / Key, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return io.BytesIO()
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def open_writer(self, Key: str) -> BinaryIO:
+        stored = self.root / Key
+        stored.parent.mkdir(parents=True, exist_ok=True)
+        return _CommitOnClose(lambda data: _atomic_write(stored, data))
+
+    def _transfer(self, source: Path, destn: Path) -> None:
+        if self.link:
+            link_or_copy(source, destn)
+        else:
+            shutil.copyfile(source, destn)
+
+
+_memory_objects: Dict[str, Dict[str, Tuple[bytes, str]]] = {}
+_memory_lock = threading.Lock()
+
+
+@dataclass
+class MemoryStorage:
+    """
+    Object store held in memory, shared by all storages with the same name in the process.
+
+    Each request can be slowed down by `latency` and `bandwidth`, to mimic a remote store
+    when testing or benchmarking transfers.
+    """
+
+    location_env_key: str
+    """Name of the store"""
+
+    latency: float = 0.0
+    "Seconds added to each request"
+
+    bandwidth: Optional[float] = None
+    "Bytes per second of each transfer, unlimited if None"
+
+    requests: int = field(default=0, init=False)
+    objects: Dict[str, Tuple[bytes, str]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        with _memory_lock:
+            self.objects = _memory_objects.setdefault(self.location_env_key, {})
+
+    def put(self, Key: str, data: bytes) -> None:
+        self.objects[Key] = (bytes(data), hashlib.md5(data).hexdigest())
+
+    def get(self, Key: str) -> bytes:
+        return self.objects[Key][0]
+
+    def downloader(self, Key: str, Filename: str):
+        try:
+            data, _ = self.objects[Key]
+        except KeyError:
+            raise DownloadError(f"{Key} not found in {self.location_env_key}")
+        self._request(len(data))
+        Path(Filename).write_bytes(data)
+
+    def uploader(self, Key: str, Filename: str, Sha256: Optional[str] = None,
+                 ContentType: Optional[str] = None):
+        data = Path(Filename).read_bytes()
+        self._request(len(data))
+        self.put(Key, data)
+
+    def delete(self, Key: str) -> None:
+        self._request(0)
+        self.objects.pop(Key, None)
+
+    def content_hash(self, Key: str) -> Optional[str]:
+        self._request(0)
+        if stored := self.objects.get(Key):
+            return hashlib.sha256(stored[0]).hexdigest()
+        return None
+
+    async def async_downloader(self, Key: str, Filename: str):
+        try:
+            data, _ = self.objects[Key]
+        except KeyError:
+            raise DownloadError(f"{Key} not found in {self.location_env_key}")
+        await asyncio.sleep(self._count_request(len(data)))
+        Path(Filename).write_bytes(data)
+
+    async def async_uploader(self, Key: str, Filename: str):
+        data = Path(Filename).read_bytes()
+        await asyncio.sleep(self._count_request(len(data)))
+        self.put(Key, data)
+
+    def object_size(self, Key: str) -> Optional[int]:
+        self._request(0)
+        if stored := self.objects.get(Key):
+            return len(stored[0])
+        return None
+
+    def fingerprint(self, Key: str) -> Optional[str]:
+        self._request(0)
+        if stored := self.objects.get(Key):
+            return f"{self.location_env_key}/{Key}@{stored[1]}"
+        return None
+
+    def list_keys(self, Prefix: str) -> Iterator[str]:
+        self._request(0)
+        yield from sorted(key for key in list(self.objects) if key.startswith(Prefix))
+
+    def open_reader(self, Key: str) -> BinaryIO:
+        data = self.get(Key)
+        self._request(len(data))
+        return io.BytesIO(data)
+
+    def open_writer(self, Key: str) -> BinaryIO:
+        def commit(data: bytes):
+            self._request(len(data))
+            self.put(Key, data)
+        return _CommitOnClose(commit)
+
+    def clear(self) -> None:
+        self.objects.clear()
+
+    def _request(self, size: int) -> None:
+        if delay := self._count_request(size):
+            time.sleep(delay)
+
+    def _count_request(self, size: int) -> float:
+        """Count a request, returning its delay"""
+        with _memory_lock:
+            self.requests += 1
+        delay = self.latency
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        return delay
+
+
+class _CommitOnClose(io.BytesIO):
+    """Buffer passed to `commit` when closed, unless aborted"""
+
+    def __init__(self, commit):
+        super().__init__()
+        self._commit = commit
+
+    def close(self) -> None:
+        if not self.closed:
+            self._commit(self.getvalue())
+        super().close()
+
+    def abort(self) -> None:
+        super().close()
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    fd, partial = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "wb") as fp:
+        fp.write(data)
+    os.replace(partial, path)
@@ -1,9 +1,23 @@
+import functools
+import json
+import os
+import tempfile
+import time
 from dataclasses import dataclass, field
-from pathlib import Path, PurePath
-from typing import (Any, Callable, Dict, List, Optional, Tuple, Type, Union)
+from pathlib import Path, PurePath, PurePosixPath
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, Union)
 import warnings
 
+from .cache import DownloadCache
+from .compression import Codec, codec_from_key, compress_file, decompress_file, get_codec
+from .lazy import LazyPath
+from .metrics import InvocationMetrics, phase
+from .multipart import file_sha256
+from .pipeline import FusedOutputs
+from .template import PathTemplate, compile_templates
+from .transfer import run_transfers
 from .types import *
+from .watch import OutputWatcher
 
 
 @dataclass
@@ -32,36 +46,191 @@ class EventFSMap:
     arg_override_downloader: Dict[str, Downloader] = \
         field(default_factory=dict)
 
+    lister: Optional[Lister] = field(default=None)
+    "Lists the objects of wildcard sources"
+
+    arg_override_lister: Dict[str, Lister] = field(default_factory=dict)
+
+    wild_sources: Dict[str, Path] = field(init=False)
+    "Local directory of each wildcard source"
+
+    max_download_workers: int = field(default=1)
+    "Number of sources downloaded concurrently"
+
+    max_upload_workers: int = field(default=1)
+    "Number of destination files uploaded concurrently"
+
+    download_cache: Optional[DownloadCache] = field(default=None)
+    "Cache consulted before downloading a source, requires a `fingerprint`"
+
+    fingerprint: Optional[Fingerprint] = field(default=None)
+
+    arg_override_fingerprint: Dict[str, Fingerprint] = \
+        field(default_factory=dict)
+
+    lazy_sources: bool = field(default=False)
+    "Download each source only when its path is first accessed"
+
+    watch_outputs: Optional[float] = field(default=None)
+    """Seconds between scans of wildcard destinations, whose files are uploaded in the background
+    while the function runs. None uploads all of them after the function returns."""
+
+    output_watcher: Optional[OutputWatcher] = field(default=None, init=False)
+
+    deleter: Optional[Deleter] = field(default=None)
+    "Removes the objects of files deleted or renamed after their upload by `output_watcher`"
+
+    fused_outputs: Optional[FusedOutputs] = field(default=None)
+    "Outputs of earlier handlers of a `Pipeline`, used instead of transfers"
+
+    content_hash: Optional[ContentHash] = field(default=None)
+    "Skip uploads whose content has the same SHA256 as the stored object, if provided"
+
+    deduplicated: List[Tuple[str, int]] = field(default_factory=list, init=False)
+    "Key and bytes of each upload skipped by `content_hash`"
+
+    compress: Dict[str, str] = field(default_factory=dict)
+    "Codec (e.g. gzip) by destination name, whose keys get the suffix of the codec"
+
+    decompress: Dict[str, str] = field(default_factory=dict)
+    """Codec by source name, `auto` for the suffix of the key. The `codec` given with a source
+    in the event (as returned for compressed destinations) takes precedence."""
+
+    source_codecs: Dict[str, Codec] = field(init=False)
+    "Codec of each compressed source, by local path"
+
+    destn_codecs: Dict[str, Codec] = field(init=False)
+    "Codec of each compressed destination, by destination name"
+
+    fetched: List[str] = field(init=False)
+    "Names of the sources downloaded so far"
+
+    metrics: Optional[InvocationMetrics] = field(default=None)
+    "Records phase timings and transfers, if provided"
+
+    event_names: Dict[str, str] = field(init=False)
+    "Template names given by the event, e.g. {doc}"
+
+    destn_rendered: Dict[str, str] = field(init=False)
+    "Relative path of each destination (possibly with wildcards)"
+
     def __post_init__(self) -> None:
 
+        downloads = self.prepare_sources()
+
+        if self.lazy_sources:
+            # wildcard sources are passed as directories, downloaded beforehand
+            with phase(self.metrics, "download"):
+                run_transfers([functools.partial(self.download_source, source_name, s3_args)
+                               for source_name, s3_args in downloads if source_name in self.wild_sources],
+                              max_workers=self.max_download_workers)
+            self.locate_sources(downloads, lambda source_name, s3_args: LazyPath(
+                s3_args['Filename'], functools.partial(self.download_source, source_name, s3_args)))
+        else:
+            with phase(self.metrics, "download"):
+                run_transfers([functools.partial(self.download_source, source_name, s3_args)
+                               for source_name, s3_args in downloads],
+                              max_workers=self.max_download_workers)
+
+            self.locate_sources(
+                downloads, lambda source_name, s3_args: Path(s3_args['Filename']))
+
+        self.prepare_destn()
+
+    def locate_sources(self, downloads: List[Tuple[str, Dict[str, str]]],
+                       locate: Callable[[str, Dict[str, str]], Any]) -> None:
+        """Set the local path of each source, a list of paths for list sources"""
+        for source_name in self.source:
+            if isinstance(self.event.get(source_name), list):
+                self.source_locations[source_name] = []
+
+        for source_name, s3_args in downloads:
+            if source_name in self.wild_sources:
+                continue
+            location = locate(source_name, s3_args)
+            if isinstance(self.source_locations.get(source_name), list):
+                self.source_locations[source_name].append(location)
+            else:
+                self.source_locations[source_name] = location
+
+        self.source_locations.update(self.wild_sources)
+
+    def prepare_sources(self) -> List[Tuple[str, Dict[str, str]]]:
+        """Resolve names and local paths of sources, returning the pending downloads"""
+
         if not self.root:
             self.root = Path(self.name)
 
-        self.source_locations = {'_root': self.root}
+        self.fetched = []
+        self.source_locations = {'_root': self.root, '_fetched': self.fetched,
+                                 '_deduplicated': self.deduplicated}
 
-        self.all_uploads = {}
+        self.prepare_names()
 
-        # map template names, e.g. {file} to key
-        self.current_names = {'_return': self.all_uploads}
+        return list(self.iter_fs_maps(map_=self.source, event=self.event, create_path=True,
+                                      ignore_missing_keys=self.ignore_missing_source))
 
-        if doc := self.event.get("document", None):
-            self.current_names['doc'] = doc['name']
-
-        for source_name, s3_args in self.iter_fs_maps(map_=self.source, event=self.event, create_path=True,
-                                                      ignore_missing_keys=self.ignore_missing_source):
-            try:
-                downloader = self.arg_override_downloader.get(
-                    source_name, self.downloader)
-                downloader(**s3_args)
-            except DownloadError as exc:
-                raise DownloadError(
-                    f"Error downloading source key {source_name}: {self.source[source_name]}, from {s3_args}:: {exc.args[0]}")
-            self.source_locations[source_name] = Path(s3_args['Filename'])
+    def prepare_destn(self) -> None:
+        self.destn_rendered = {key: template.render(self.current_names)
+                               for key, template in self.destn.items()}
 
         self.make_destn_paths()
 
         self.source_locations['_save'] = self.save_destn(dryrun=True)
 
+    def prepare_names(self) -> None:
+        self.source = compile_templates(self.source)
+        self.destn = compile_templates(self.destn)
+
+        self.all_uploads = {}
+        self.wild_sources = {}
+        self.source_codecs = {}
+        self.destn_codecs = {key: codec for key, name in self.compress.items()
+                             if (codec := get_codec(name))}
+
+        # map template names, e.g. {file} to key
+        self.current_names = {'_return': self.all_uploads}
+
+        self.event_names = event_names(self.event)
+        self.current_names.update(self.event_names)
+
+    def download_source(self, source_name: str, s3_args: Dict[str, str]) -> None:
+        if codec := self.source_codecs.get(s3_args['Filename']):
+            # downloaded as is, then decompressed in place of the source
+            compressed = dict(s3_args, Filename=s3_args['Filename'] + codec.suffix)
+            self.download_source_as_is(source_name, compressed)
+            decompress_file(codec, compressed['Filename'], s3_args['Filename'])
+            os.unlink(compressed['Filename'])
+        else:
+            self.download_source_as_is(source_name, s3_args)
+
+    def download_source_as_is(self, source_name: str, s3_args: Dict[str, str]) -> None:
+        start = time.perf_counter()
+        extra = {}
+        try:
+            downloader = self.arg_override_downloader.get(
+                source_name, self.downloader)
+            fingerprint = self.arg_override_fingerprint.get(
+                source_name, self.fingerprint)
+            if self.fused_outputs and self.fused_outputs.fetch(**s3_args):
+                extra['local'] = True
+            elif self.download_cache and fingerprint:
+                extra['cache_hit'] = self.download_cache.fetch(
+                    downloader, fingerprint, **s3_args)
+            else:
+                downloader(**s3_args)
+        except DownloadError as exc:
+            raise self.download_error(source_name, s3_args, exc)
+        if source_name not in self.fetched:
+            self.fetched.append(source_name)
+        if self.metrics:
+            self.metrics.transfer("download", source_name, s3_args['Key'],
+                                  _file_size(s3_args['Filename']), time.perf_counter() - start, **extra)
+
+    def download_error(self, source_name: str, s3_args: Dict[str, str], exc: DownloadError) -> DownloadError:
+        return DownloadError(
+            f"Error downloading source key {source_name}: {self.source[source_name]}, from {s3_args}:: {exc.args[0]}")
+
     def iter_fs_maps(self, map_: Dict[str, str], event: dict, create_path: bool,
                      ignore_missing_keys=None):
 
@@ -72,99 +241,276 @@ class EventFSMap:
                 if ignore_missing_keys and _name in ignore_missing_keys:
                     continue
                 raise
-            try:
-                key = mapx["key"]
-            except KeyError:
-                warnings.warn(f"'key' not found in event data: {mapx}")
-                raise
+            if PathTemplate.compile(_fs).is_wild:
+                yield from self.iter_wild_source(_name, _fs, mapx, event, create_path)
+                continue
+            if isinstance(mapx, list):
+                # list source, one file per item
+                if "file" not in PathTemplate.compile(_fs).names:
+                    raise ValueError(
+                        f"Path of list source {_name} must include {{file}}: {_fs}")
+                items = mapx
+            else:
+                items = [mapx]
 
-            destn = self.root / \
-                self.format_path_from_event(
-                    _fs, mapx, ignore_prefix=_name, docinfo=event)
+            for mapx in items:
+                try:
+                    key = mapx["key"]
+                except KeyError:
+                    warnings.warn(f"'key' not found in event data: {mapx}")
+                    raise
+
+                destn = self.root / \
+                    self.format_path_from_event(
+                        _fs, mapx, ignore_prefix=_name, docinfo=event)
+                destn = self.decoded_path(_name, key, destn, mapx.get("codec"))
+                if create_path:
+                    destn.parent.mkdir(parents=True, exist_ok=True)
+                yield _name, dict(Key=key, Filename=str(destn))
+
+    def iter_wild_source(self, name: str, template: Union[str, PathTemplate], mapx: Dict[str, str],
+                         event: dict, create_path: bool):
+        """
+        Downloads of the objects of wildcard source `name`, symmetric with wildcard destinations.
+
+        The event gives either a `prefix` (a directory), whose objects are matched against the
+        wildcards of the source path, or a wildcard `key`. Objects are listed with `lister`.
+        """
+
+        if prefix := mapx.get("prefix"):
+            pattern = None
+        elif path_is_wild(key := mapx.get("key", "")):
+            parent = PurePosixPath(key).parent
+            while path_is_wild(parent):
+                parent = parent.parent
+            prefix = str(parent) if str(parent) != "." else ""
+            pattern = key[len(prefix):].lstrip("/")
+        else:
+            raise ValueError(
+                f"Wildcard source {name} requires a `prefix` or a wildcard `key` in the event: {mapx}")
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+
+        rendered = self.format_path_from_event(
+            template, dict(key=prefix.rstrip("/") or name), ignore_prefix=name, docinfo=event)
+        parent = wild_path_parent(rendered)
+        if pattern is None:
+            pattern = Path(rendered).relative_to(parent).as_posix()
+
+        # a top-level pattern must not share the working directory of the run
+        directory = self.root / (parent if parent != Path(".") else name)
+        self.wild_sources[name] = directory
+        if create_path:
+            directory.mkdir(parents=True, exist_ok=True)
+
+        lister = self.arg_override_lister.get(name, self.lister)
+        if self.fused_outputs:
+            lister = self.fused_outputs.lister(lister)
+        if lister is None:
+            raise ValueError(f"Wildcard source {name} requires a storage able to list objects")
+
+        depth = len(PurePosixPath(pattern).parts)
+        for key in lister(Prefix=prefix):
+            relative = PurePosixPath(key[len(prefix):])
+            if len(relative.parts) != depth or not relative.match(pattern):
+                continue
+            destn = self.decoded_path(name, key, directory / relative, mapx.get("codec"))
             if create_path:
                 destn.parent.mkdir(parents=True, exist_ok=True)
-            yield _name, dict(Key=key, Filename=str(destn))
+            yield name, dict(Key=key, Filename=str(destn))
+
+    def decoded_path(self, name: str, key: str, path: Path, codec: Optional[str] = None) -> Path:
+        """Local path of source `key`, without the suffix of its codec (if compressed)"""
+        codec = codec or self.decompress.get(name)
+        if not (codec := codec_from_key(key) if codec == "auto" else get_codec(codec)):
+            return path
+        if path.name.endswith(codec.suffix):
+            path = path.with_name(path.name[:-len(codec.suffix)])
+        self.source_codecs[str(path)] = codec
+        return path
 
     def make_destn_paths(self):
-        for key, file_path in self.destn.items():
-            file_path = file_path.format(**self.current_names)
+        for file_path in self.destn_rendered.values():
             (self.root / file_path).parent.mkdir(parents=True, exist_ok=True)
 
     def save_destn(self, dryrun=False):
+        destn_paths, uploads = self.collect_destn(dryrun=dryrun)
+
+        if uploads:
+            self.upload_all(uploads)
+
+        return destn_paths
+
+    def collect_destn(self, dryrun=False) -> Tuple[Dict[str, Any], List[Tuple[str, Dict[str, str]]]]:
+        """Local path of each destination, and the uploads to be made (none if `dryrun`)"""
         destn_paths: Dict[str, Path] = {}
+        uploads: List[Tuple[str, Dict[str, str]]] = []
         key, has_multiple = None, []
-        for key, file_path in self.destn.items():
-            file_path = file_path.format(**self.current_names)
-            if path_is_wild(str(file_path)):
+        for key, file_path in self.destn_rendered.items():
+            if self.destn[key].is_wild:
                 has_multiple.append(key)
                 continue
-            upload_key = Path(key) / file_path
-            if self.require_save_prefix:
-                upload_key = Path(self.require_save_prefix) / upload_key
+            upload_key = self.destn_key(key, file_path)
             destn_paths[key] = self.root / file_path
             if not dryrun:
-                try:
-                    self.uploader(
-                        Filename=str(destn_paths[key]),
-                        Key=str(upload_key))
-                except FileNotFoundError:
-                    if key not in self.ignore_missing_destn:
-                        raise
-                else:
-                    self.all_uploads[key] = dict(key=str(upload_key))
+                uploads.append((key, dict(Filename=str(destn_paths[key]),
+                                          Key=str(upload_key))))
 
         for key in has_multiple:
             if dryrun:
-                path = wild_path_parent(
-                    self.destn[key].format(**self.current_names))
+                path = wild_path_parent(self.destn_rendered[key])
                 path = self.root / path
                 path.mkdir(parents=True, exist_ok=True)
                 destn_paths[key] = path
             else:
-                self.save_destn_wildcard(
-                    key, destn_paths=destn_paths, dryrun=dryrun)
+                uploads.extend(self.iter_destn_wildcard(
+                    key, destn_paths=destn_paths))
 
-        return destn_paths
+        return destn_paths, uploads
 
     def save_destn_wildcard(self, key: str, destn_paths=None,
                             dryrun=False):
 
-        upload_wild_path = self.destn[key].format(**self.current_names)
-
         if destn_paths == None:
             destn_paths = {}
-        destn_paths[key] = []
-        self.all_uploads[key] = []
 
-        for file_path in self.root.glob(upload_wild_path):
+        uploads = list(self.iter_destn_wildcard(key, destn_paths=destn_paths))
+        if not dryrun:
+            self.upload_all(uploads)
+
+        return destn_paths
 
-            if file_path.is_absolute():
-                file_path = file_path.relative_to(self.root)
+    def iter_destn_wildcard(self, key: str, destn_paths: Dict[str, Any]):
+
+        destn_paths[key] = []
+        self.all_uploads[key] = []
 
+        for file_path, s3_args in self.wildcard_uploads(key):
             destn_paths[key].append(file_path)
-            upload_key = Path(key) / file_path
-            if self.require_save_prefix:
-                upload_key = Path(self.require_save_prefix) / upload_key
-            if not dryrun:
-                self.uploader(Filename=str(self.root / file_path),
-                              Key=str(upload_key))
-                self.all_uploads[key].append(str(upload_key))
+            yield key, s3_args
+
+    def wildcard_uploads(self, key: str) -> Iterator[Tuple[Path, Dict[str, str]]]:
+        """Relative path and upload of each file currently matching wildcard destination `key`"""
+
+        # sorted, so that the returned list does not depend on the file system
+        for file_path in sorted(self.root.glob(self.destn_rendered[key])):
+
+            file_path = file_path.relative_to(self.root)
+
+            upload_key = self.destn_key(key, file_path)
+            yield file_path, dict(Filename=str(self.root / file_path), Key=str(upload_key))
+
+    def destn_key(self, key: str, file_path: Union[Path, str]) -> Path:
+        upload_key = Path(key) / file_path
+        if self.require_save_prefix:
+            upload_key = Path(self.require_save_prefix) / upload_key
+        if (codec := self.destn_codecs.get(key)) and not upload_key.name.endswith(codec.suffix):
+            upload_key = upload_key.with_name(upload_key.name + codec.suffix)
+        return upload_key
+
+    def upload_all(self, uploads: List[Tuple[str, Dict[str, str]]]) -> None:
+        # skip files uploaded in the background and unchanged since
+        skip = [bool(self.output_watcher and self.output_watcher.uploaded(s3_args))
+                for _, s3_args in uploads]
+        uploaded = iter(run_transfers([functools.partial(self.upload_destn, key, s3_args)
+                                       for (key, s3_args), skipped in zip(uploads, skip) if not skipped],
+                                      max_workers=self.max_upload_workers))
+        self.record_uploads(uploads, [skipped or next(uploaded) for skipped in skip])
+
+    def record_uploads(self, uploads: List[Tuple[str, Dict[str, str]]], uploaded: List[bool]) -> None:
+        # record in the order of `uploads`, irrespective of completion order
+        for (key, s3_args), done in zip(uploads, uploaded):
+            if not done:
+                continue
+            if isinstance(self.all_uploads.get(key), list):
+                self.all_uploads[key].append(s3_args['Key'])
+            elif codec := self.destn_codecs.get(key):
+                self.all_uploads[key] = dict(key=s3_args['Key'], codec=codec.name)
+            else:
+                self.all_uploads[key] = dict(key=s3_args['Key'])
 
-        return destn_paths
+    def upload_destn(self, key: str, s3_args: Dict[str, str]) -> bool:
+        if not (codec := self.destn_codecs.get(key)):
+            return self.upload_destn_as_is(key, s3_args)
+
+        fd, compressed = tempfile.mkstemp(suffix=codec.suffix)
+        os.close(fd)
+        try:
+            try:
+                digest = compress_file(codec, s3_args['Filename'], compressed)
+            except FileNotFoundError:
+                if key not in self.ignore_missing_destn:
+                    raise
+                return False
+            return self.upload_destn_as_is(key, dict(s3_args, Filename=compressed), digest=digest,
+                                           ContentType=codec.content_type)
+        finally:
+            os.unlink(compressed)
+
+    def upload_destn_as_is(self, key: str, s3_args: Dict[str, str], digest: Optional[str] = None,
+                           **options) -> bool:
+        start = time.perf_counter()
+        try:
+            if self.fused_outputs and not self.fused_outputs.keep(key, **s3_args):
+                return True
+            if self.content_hash:
+                # the digest decides whether to upload and goes into the metadata of the upload, so
+                # it precedes the upload (a second read of the file, unless given from compression)
+                digest = digest or file_sha256(s3_args['Filename'])
+                if self.content_hash(s3_args['Key']) == digest:
+                    size = _file_size(s3_args['Filename'])
+                    self.deduplicated.append((s3_args['Key'], size))
+                    if self.metrics:
+                        self.metrics.count("dedup_skipped")
+                        self.metrics.count("dedup_bytes_saved", size)
+                    return True
+                self.uploader(**s3_args, Sha256=digest, **options)
+            else:
+                self.uploader(**s3_args, **options)
+        except FileNotFoundError:
+            if key not in self.ignore_missing_destn:
+                raise
+            return False
+        if self.metrics:
+            self.metrics.transfer("upload", key, s3_args['Key'],
+                                  _file_size(s3_args['Filename']), time.perf_counter() - start)
+        return True
 
     def __exit__(self,
                  exc_type: Optional[Type[BaseException]],
                  exc_val: Optional[BaseException],
                  exc_tb) -> None:
 
+        if self.output_watcher:
+            with phase(self.metrics, "upload_wait"):
+                self.output_watcher.stop(cancel=bool(exc_type))
+
         if not exc_type:
             # no exception has been hit
-            self.save_destn()
+            with phase(self.metrics, "upload"):
+                self.save_destn()
+                if self.output_watcher:
+                    self.delete_stale()
+
+    def delete_stale(self) -> None:
+        """Delete background uploads of files which the function then deleted or renamed"""
+        final_keys = [upload_key for key in self.output_watcher.keys
+                      for upload_key in self.all_uploads.get(key, [])]
+        for upload_key in self.output_watcher.stale(final_keys):
+            if self.deleter is None:
+                warnings.warn(f"Stale background upload {upload_key} left, no `deleter` provided")
+                continue
+            self.deleter(Key=upload_key)
+            if self.metrics:
+                self.metrics.count("stale_deleted")
 
     def __enter__(self) -> Tuple[Dict[str, Path], Dict[str, str]]:
+        if self.watch_outputs is not None and any(template.is_wild for template in self.destn.values()):
+            self.output_watcher = OutputWatcher(
+                self, interval=self.watch_outputs).start()
         return self.source_locations, self.current_names
 
-    def format_path_from_event(self, template: str, event_s3, ignore_prefix="", docinfo={}):
+    def format_path_from_event(self, template: Union[str, PathTemplate], event_s3, ignore_prefix="", docinfo={}):
         # On python >= 3.9
         # key = PurePath(event_s3["key"])
         # if ignore_prefix and key.is_relative_to(ignore_prefix):
@@ -175,29 +521,40 @@ class EventFSMap:
             key = key.split("/", maxsplit=1)[1]
         key = PurePath(key)
 
-        format_names = dict(
-            file=key.name
-        )
-        if docinfo:
+        names = self.event_names if docinfo is self.event else event_names(docinfo)
+        format_names = dict(names, file=key.name)
 
-            if doc := docinfo.get("document", None):
-                format_names['doc'] = doc["name"]
+        self.current_names.update(format_names)
+        return PathTemplate.compile(template).render(format_names)
 
-            if is_page := docinfo.get("SourcePage", None):
-                format_names['page'] = f"{is_page['index']}.jpg"
-                format_names['pagenum'] = f"{is_page['index']}"
 
-            if is_header := docinfo.get("Header", None):
-                format_names['header_index'] = f"{is_header['index']}"
+def event_names(docinfo: Dict[str, Any]) -> Dict[str, str]:
+    """Template names (other than {file}) given by the event"""
+    format_names = {}
+    if docinfo:
 
-        self.current_names.update(format_names)
-        return template.format(**format_names)
+        if doc := docinfo.get("document", None):
+            format_names['doc'] = doc["name"]
+
+        if is_page := docinfo.get("SourcePage", None):
+            format_names['page'] = f"{is_page['index']}.jpg"
+            format_names['pagenum'] = f"{is_page['index']}"
+
+        if is_header := docinfo.get("Header", None):
+            format_names['header_index'] = f"{is_header['index']}"
+
+    return format_names
 
 
 def return_body(event, s3map, list_keys: List[str] = None,
                 extra_return: Dict[str, Any] = None,
-                additional_info: INFO_FROM_PATH = None, key_copy: List[str] = None):
+                additional_info: INFO_FROM_PATH = None, key_copy: List[str] = None,
+                codecs: Dict[str, str] = None):
 
+    list_keys = list_keys or []
+    extra_return = extra_return or {}
+
+    # a single shallow copy of the event, items of lists share the values of `key_copy`
     out = dict(event)
     if retn := s3map.get('_return'):
         out.update(retn)
@@ -209,44 +566,59 @@ def return_body(event, s3map, list_keys: List[str] = None,
                     cur.update(value)
 
     for listed in list_keys:
-        data = return_body_list(event, s3map=s3map, multiples_key=listed,
-                                root_list_key=listed, get_additional_info=additional_info,
-                                top_level_list=False)
-        for key in (key_copy or []):
-            for item in data[listed]:
-                item.update({key: out[key]})
-                if val := extra_return.get(listed):
-                    assert isinstance(val, dict)
-                    item[listed].update(val)
-        out[listed] = data[listed]
+        copied = {key: out[key] for key in (key_copy or [])}
+        extra = extra_return.get(listed) if copied else None
+        assert not extra or isinstance(extra, dict)
+        codec = (codecs or {}).get(listed)
+
+        items = []
+        for sub_path in s3map['_return'][listed]:
+            x = {'key': str(sub_path)}
+            if codec:
+                x['codec'] = codec
+            if additional_info:
+                x.update(additional_info(Path(sub_path)))
+            if extra:
+                x.update(extra)
+            items.append({listed: x, **copied})
+        out[listed] = items
 
     return out
 
 
-def return_body_list(event, s3map, multiples_key: str, root_list_key: str,
-                     get_additional_info: INFO_FROM_PATH = None,
-                     top_level_list=True):
+PAYLOAD_LIMIT = 256 * 1024
+"Maximum bytes of a Step Functions payload (and of an asynchronous Lambda invocation)"
 
-    out = dict(event)
-    listed = []
-    out[root_list_key] = listed
 
-    for sub_path in s3map['_return'][multiples_key]:
-        x = {'key': str(sub_path)}
+def payload_size(body: Any) -> int:
+    """Bytes of `body` serialized as compact JSON"""
+    return len(json.dumps(body, separators=(",", ":"), default=str).encode())
 
-        if get_additional_info:
-            x.update(get_additional_info(Path(sub_path)))
 
-        listed.append({multiples_key: x})
+def spill_lists(body: Dict[str, Any], list_keys: List[str], uploader: Uploader,
+                manifest_key: Callable[[str], str]) -> None:
+    """Upload each list of `list_keys` in `body` as a JSON Lines object at `manifest_key(list_key)`,
+    replacing it with `{"manifest": {"key": ..., "count": ...}}`"""
 
-    for constant_key, path in s3map['_return'].items():
-        if constant_key != multiples_key:
-            if top_level_list:
-                for item in listed:
-                    item[constant_key] = {'key': str(path)}
-            else:
-                out[constant_key] = path
-    return out
+    for listed in list_keys:
+        items = body[listed]
+        key = manifest_key(listed)
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as fp:
+            for item in items:
+                fp.write(json.dumps(item, separators=(",", ":"), default=str))
+                fp.write("\n")
+        try:
+            uploader(Key=key, Filename=fp.name)
+        finally:
+            os.unlink(fp.name)
+        body[listed] = dict(manifest=dict(key=key, count=len(items)))
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
 
 
 def path_is_wild(path: Path) -> bool:
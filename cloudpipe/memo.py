@@ -0,0 +1,108 @@
+import functools
+import hashlib
+import json
+import tempfile
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterator, Optional
+
+from .pipeline import current_outputs
+from .types import *
+
+
+def memoize(handler: HANDLER, step: Any, name: str, source: MAP_SOURCE, destn: MAP_DESTN = None) -> HANDLER:
+    """
+    Skip `handler` when an identical event with unchanged sources (per storage fingerprint) and
+    `step.code_version` has already completed, and its outputs still exist, returning the response
+    stored in its manifest.
+
+    Each event (e.g. each page of a document) has its own manifest, stored with the outputs under
+    `<save_prefix>/_manifest/<name>/<document>/`, and replaced when its sources or the code change.
+    """
+
+    @functools.wraps(handler)
+    def memoized(event, context):
+        if current_outputs.get() is not None:
+            # outputs of a pipeline are not all uploaded, so cannot be reused
+            return handler(event, context)
+
+        if (fingerprint := event_fingerprint(step, name, source, event)) is None:
+            return handler(event, context)
+
+        manifest_key = str(PurePosixPath(step.save_prefix or "") / "_manifest" / name /
+                           ((event.get('document') or {}).get('name') or "_") / f"{event_digest(event)}.json")
+
+        if manifest := load_manifest(step, manifest_key):
+            if manifest.get("fingerprint") == fingerprint and \
+                    outputs_exist(step, manifest["response"], destn or {}):
+                return dict(manifest["response"], memoized=True)
+
+        response = handler(event, context)
+        save_manifest(step, manifest_key, dict(fingerprint=fingerprint, response=response))
+        return response
+
+    return memoized
+
+
+def event_fingerprint(step: Any, name: str, source: MAP_SOURCE, event: Dict[str, Any]) -> Optional[str]:
+    """Digest of the event, the content of its sources and the code version. None if a source is unknown."""
+
+    sources = {}
+    for source_name in source:
+        mapx = event.get(source_name)
+        items = mapx if isinstance(mapx, list) else [mapx]
+        if isinstance(mapx, dict) and "prefix" in mapx:
+            # the objects of a wildcard source are not known beforehand
+            return None
+        if not all(isinstance(item, dict) and "key" in item for item in items):
+            continue
+        fingerprint = step.arg_override_fingerprint.get(
+            source_name, step.fingerprint)
+        tags = [fingerprint(item["key"]) if fingerprint else None for item in items]
+        if None in tags:
+            return None
+        sources[source_name] = tags if isinstance(mapx, list) else tags[0]
+
+    data = json.dumps(dict(function=name, code_version=step.code_version,
+                           event=event, sources=sources), sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def event_digest(event: Dict[str, Any]) -> str:
+    """Digest of the event alone, identifying the manifest of an event whatever its sources contain"""
+    data = json.dumps(event, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def output_keys(response: Dict[str, Any], destn: MAP_DESTN) -> Iterator[str]:
+    body = response.get("body") or {}
+    for destn_name in destn:
+        value = body.get(destn_name)
+        if isinstance(value, list):
+            yield from (item[destn_name]["key"] for item in value)
+        elif isinstance(value, dict):
+            # a single output, or the manifest of a spilled list
+            yield (value.get("manifest") or value)["key"]
+
+
+def outputs_exist(step: Any, response: Dict[str, Any], destn: MAP_DESTN) -> bool:
+    """Whether the outputs listed in `response` are all still stored (per storage fingerprint)"""
+    return all(step.fingerprint(key) is not None for key in output_keys(response, destn))
+
+
+def load_manifest(step: Any, manifest_key: str) -> Optional[Dict[str, Any]]:
+    if step.fingerprint is None or step.fingerprint(manifest_key) is None:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "manifest.json"
+        step.downloader(Key=manifest_key, Filename=str(path))
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+
+def save_manifest(step: Any, manifest_key: str, manifest: Dict[str, Any]) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "manifest.json"
+        path.write_text(json.dumps(manifest, default=str))
+        step.uploader(Key=manifest_key, Filename=str(path))
@@ -0,0 +1,100 @@
+import contextlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .types import *
+
+
+@dataclass
+class InvocationMetrics:
+    """Phase timings and transfers of a single invocation"""
+
+    function: str = ""
+    phases: Dict[str, float] = field(default_factory=dict)
+    "Milliseconds spent per phase"
+
+    transfers: List[Dict[str, Any]] = field(default_factory=list)
+    "One entry per transferred file, with its direction, argument name, key, bytes and milliseconds"
+
+    counters: Dict[str, float] = field(default_factory=dict)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + \
+                (time.perf_counter() - start) * 1e3
+
+    def transfer(self, direction: str, name: str, key: str, size: int,
+                 duration: float, **extra) -> None:
+        self.transfers.append(dict(direction=direction, name=name, key=key,
+                                   bytes=size, ms=duration * 1e3, **extra))
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self) -> Dict[str, Any]:
+        totals: Dict[str, float] = {}
+        for transfer in self.transfers:
+            direction = transfer["direction"]
+            totals[f"{direction}_bytes"] = totals.get(
+                f"{direction}_bytes", 0) + transfer["bytes"]
+            totals[f"{direction}_count"] = totals.get(
+                f"{direction}_count", 0) + 1
+        return dict(function=self.function,
+                    phases=dict(self.phases),
+                    totals={**totals, **self.counters},
+                    transfers=list(self.transfers))
+
+
+def phase(metrics: Optional[InvocationMetrics], name: str):
+    """Time `name` in `metrics`, if any"""
+    return metrics.phase(name) if metrics else contextlib.nullcontext()
+
+
+@dataclass
+class MemoryCollector:
+    """Keeps every record in memory, e.g. for tests"""
+
+    records: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        self.records.append(record)
+
+
+@dataclass
+class EMFExporter:
+    """Prints each record as a CloudWatch Embedded Metric Format log line"""
+
+    namespace: str = "cloudpipe"
+    dimensions: Sequence[str] = ("function",)
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        values = {f"{name}_ms": value for name,
+                  value in record["phases"].items()}
+        values.update(record["totals"])
+
+        metrics = [dict(Name=name, Unit=_unit(name)) for name in values]
+        print(json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1e3),
+                "CloudWatchMetrics": [dict(Namespace=self.namespace,
+                                           Dimensions=[list(self.dimensions)],
+                                           Metrics=metrics)],
+            },
+            "function": record["function"],
+            **values,
+            "transfers": record["transfers"],
+        }))
+
+
+def _unit(name: str) -> str:
+    if name.endswith("_ms"):
+        return "Milliseconds"
+    if name.endswith("_bytes"):
+        return "Bytes"
+    return "Count"
@@ -0,0 +1,222 @@
+import base64
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
+
+from .transfer import run_transfers
+from .types import *
+
+SHA256_METADATA = "cloudpipe-sha256"
+"Object metadata holding the SHA256 of the whole object, verified after downloads"
+
+CHUNK_SIZE = 2 ** 20
+"Bytes read from a ranged GET at once, written to the partial file as they arrive"
+
+_partial_locks: Dict[str, threading.Lock] = {}
+_partial_locks_lock = threading.Lock()
+
+
+def _partial_lock(name: str) -> threading.Lock:
+    with _partial_locks_lock:
+        return _partial_locks.setdefault(name, threading.Lock())
+
+
+def _in_progress(name: str) -> bool:
+    with _partial_locks_lock:
+        return (lock := _partial_locks.get(name)) is not None and lock.locked()
+
+
+def trim_partials(partial_dir: Path, max_age: Optional[float] = None, size: Optional[int] = None,
+                  names: Optional[List[str]] = None) -> int:
+    """
+    Remove partial downloads (with their state) from `partial_dir`, oldest first: those older than
+    `max_age` seconds, then others until the remaining ones total at most `size` bytes, or those
+    named in `names`. Downloads in progress in this process are kept. Returns the bytes removed.
+    """
+    try:
+        entries = [(path.stat(), path) for path in Path(partial_dir).iterdir()
+                   if path.suffix != ".json" and not _in_progress(path.name)]
+    except FileNotFoundError:
+        return 0
+    entries.sort(key=lambda entry: entry[0].st_mtime)
+    total = sum(stat.st_size for stat, _ in entries)
+
+    removed = 0
+    for stat, path in entries:
+        expired = max_age is not None and time.time() - stat.st_mtime > max_age
+        if not (expired or (size is not None and total - removed > size) or path.name in (names or [])):
+            continue
+        path.unlink(missing_ok=True)
+        path.with_name(f"{path.name}.json").unlink(missing_ok=True)
+        removed += stat.st_size
+    return removed
+
+
+@dataclass
+class LargeObjectTransfer:
+    """
+    Transfers of large S3 objects.
+
+    Downloads use parallel ranged GETs into a partial file kept outside the invocation
+    workspace, so that a retry within the same container resumes from the completed parts.
+    The partial file is named by bucket, key and ETag, and concurrent downloads of the same
+    object within the process take turns on it. Partial files of an earlier ETag of the object,
+    or older than `max_partial_age`, are removed before each download.
+    Uploads are multipart, with a checksum per part verified by S3, and the SHA256 of the whole
+    object stored in its metadata to verify downloads end to end.
+    """
+
+    client: Any
+    bucket: str
+
+    threshold: int = 256 * 2 ** 20
+    "Objects of at least this size use this engine"
+
+    part_size: int = 64 * 2 ** 20
+    "Size of ranged GETs and upload parts (at least 5 MiB)"
+
+    max_workers: int = 8
+    "Parts transferred concurrently"
+
+    checksum: str = "SHA256"
+    "Checksum of each uploaded part: SHA256 or CRC32"
+
+    partial_dir: Path = field(default_factory=lambda: Path(
+        tempfile.gettempdir()) / "cloudpipe-partial")
+    "Set by `Step` under its `Workspace`, so that partial files count in its disk budget"
+
+    max_partial_age: float = 3600
+    "Seconds after which the partial file of a failed download is removed"
+
+    def download(self, Key: str, Filename: str) -> None:
+        head = self.client.head_object(Bucket=self.bucket, Key=Key)
+        prefix = hashlib.sha256(f"{self.bucket}/{Key}".encode()).hexdigest()[:32]
+        name = f"{prefix}-{hashlib.sha256(head['ETag'].encode()).hexdigest()[:16]}"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        trim_partials(self.partial_dir, max_age=self.max_partial_age,
+                      names=[path.name for path in self.partial_dir.glob(f"{prefix}-*")
+                             if path.suffix != ".json" and path.name != name])
+        with _partial_lock(name):
+            self._download(Key, Filename, head, name)
+
+    def _download(self, Key: str, Filename: str, head: Dict[str, Any], name: str) -> None:
+        size, etag = head["ContentLength"], head["ETag"]
+        partial = self.partial_dir / name
+        state_path = self.partial_dir / f"{name}.json"
+
+        state = dict(etag=etag, size=size, part_size=self.part_size, done=[])
+        try:
+            previous = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            previous = None
+        if previous and partial.exists() and \
+                all(previous.get(k) == state[k] for k in ("etag", "size", "part_size")):
+            state = previous
+        else:
+            with open(partial, "wb") as fp:
+                fp.truncate(size)
+
+        done: Set[int] = set(state["done"])
+        lock = threading.Lock()
+
+        def save_state(part: int):
+            with lock:
+                done.add(part)
+                state["done"] = sorted(done)
+                state_path.write_text(json.dumps(state))
+
+        fd = os.open(partial, os.O_RDWR)
+        try:
+            def fetch(part: int):
+                start = part * self.part_size
+                end = min(start + self.part_size, size) - 1
+                response = self.client.get_object(Bucket=self.bucket, Key=Key, IfMatch=etag,
+                                                  Range=f"bytes={start}-{end}")
+                body = response["Body"]
+                while chunk := body.read(CHUNK_SIZE):
+                    os.pwrite(fd, chunk, start)
+                    start += len(chunk)
+                save_state(part)
+
+            run_transfers([functools.partial(fetch, part) for part in range(_count_parts(size, self.part_size))
+                           if part not in done],
+                          max_workers=self.max_workers)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        if expected := head.get("Metadata", {}).get(SHA256_METADATA):
+            if file_sha256(partial) != expected:
+                partial.unlink(missing_ok=True)
+                state_path.unlink(missing_ok=True)
+                raise DownloadError(
+                    f"Checksum mismatch downloading {Key}, partial download discarded")
+
+        shutil.move(str(partial), Filename)
+        state_path.unlink(missing_ok=True)
+
+    def upload(self, Key: str, Filename: str, Sha256: Optional[str] = None,
+               ContentType: Optional[str] = None) -> None:
+        size = os.path.getsize(Filename)
+
+        extra = dict(ContentType=ContentType) if ContentType else {}
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=Key, ChecksumAlgorithm=self.checksum,
+            Metadata={SHA256_METADATA: Sha256 or file_sha256(Filename)}, **extra)["UploadId"]
+
+        fd = os.open(Filename, os.O_RDONLY)
+        try:
+            parts: List[Dict[str, Any]] = run_transfers(
+                [functools.partial(self._upload_part, fd, Key, upload_id, part)
+                 for part in range(_count_parts(size, self.part_size))],
+                max_workers=self.max_workers)
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=Key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts})
+        except BaseException:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=Key, UploadId=upload_id)
+            raise
+        finally:
+            os.close(fd)
+
+    def _upload_part(self, fd: int, Key: str, upload_id: str, part: int) -> Dict[str, Any]:
+        data = os.pread(fd, self.part_size, part * self.part_size)
+        checksum_name = f"Checksum{self.checksum}"
+        checksum = _part_checksum(self.checksum, data)
+        response = self.client.upload_part(Bucket=self.bucket, Key=Key, UploadId=upload_id,
+                                           PartNumber=part + 1, Body=data,
+                                           **{checksum_name: checksum})
+        return {"PartNumber": part + 1, "ETag": response["ETag"], checksum_name: checksum}
+
+
+def _count_parts(size: int, part_size: int) -> int:
+    return max(1, -(-size // part_size))
+
+
+def _part_checksum(algorithm: str, data: bytes) -> str:
+    if algorithm == "SHA256":
+        digest = hashlib.sha256(data).digest()
+    elif algorithm == "CRC32":
+        digest = zlib.crc32(data).to_bytes(4, "big")
+    else:
+        raise ValueError(f"Unsupported part checksum {algorithm}")
+    return base64.b64encode(digest).decode()
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while chunk := fp.read(2 ** 20):
+            digest.update(chunk)
+    return digest.hexdigest()
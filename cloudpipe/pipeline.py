@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+import hashlib
+import inspect
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, Iterator, Optional, Sequence
+
+from .files import link_or_copy
+from .types import *
+
+
+class FusedOutputs:
+    """
+    Outputs of the handlers of a `Pipeline` run, kept as local files.
+
+    Sources whose key was produced by an earlier handler are linked from these files instead of
+    being downloaded, and only the outputs of the last handler (or of `persist` destinations)
+    are uploaded.
+    """
+
+    def __init__(self, persist: Collection[str] = ()):
+        self.persist = persist
+        self.final = False
+        self.files: Dict[str, Path] = {}
+        self.local_downloads = 0
+        self.skipped_uploads = 0
+        self._dir = tempfile.TemporaryDirectory(prefix="cloudpipe-pipeline-")
+        self._lock = threading.Lock()
+
+    def fetch(self, Key: str, Filename: str) -> bool:
+        """Link `Key` to `Filename` if produced by an earlier handler"""
+        if (stored := self.files.get(Key)) is None:
+            return False
+        link_or_copy(stored, Path(Filename))
+        with self._lock:
+            self.local_downloads += 1
+        return True
+
+    def keep(self, name: str, Key: str, Filename: str) -> bool:
+        """Keep the output `Key` of destination `name`, returning whether it must be uploaded too"""
+        stored = Path(self._dir.name) / hashlib.sha256(Key.encode()).hexdigest()
+        link_or_copy(Path(Filename), stored)
+        with self._lock:
+            self.files[Key] = stored
+        if self.final or name in self.persist:
+            return True
+        with self._lock:
+            self.skipped_uploads += 1
+        return False
+
+    def lister(self, lister: Optional[Lister]) -> Lister:
+        """`lister` including the keys produced by earlier handlers"""
+        def list_keys(Prefix: str) -> Iterator[str]:
+            keys = {key for key in self.files if key.startswith(Prefix)}
+            if lister:
+                keys.update(lister(Prefix=Prefix))
+            yield from sorted(keys)
+        return list_keys
+
+    def close(self) -> None:
+        self._dir.cleanup()
+
+
+current_outputs: contextvars.ContextVar[Optional[FusedOutputs]] = \
+    contextvars.ContextVar("current_outputs", default=None)
+"Outputs of the `Pipeline` running in this context, if any"
+
+
+@dataclass
+class Pipeline:
+    """
+    Run `Step` handlers back to back in this process, each event being the body returned by the
+    previous handler, e.g. for fused stages or local backfills.
+
+    Files are passed between handlers locally: only the outputs of the last handler, and those
+    of `persist` destinations, are uploaded. Sources passed locally may be hard links, so must not
+    be modified in place. Streaming handlers read their sources from storage, so the outputs they
+    read must be persisted.
+    """
+
+    handlers: Sequence[Callable[[Dict[str, Any], Any], Dict[str, Any]]]
+
+    persist: Collection[str] = ()
+    "Destinations of intermediate handlers which are uploaded too"
+
+    def __call__(self, event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+        outputs = FusedOutputs(persist=self.persist)
+        token = current_outputs.set(outputs)
+        try:
+            for index, handler in enumerate(self.handlers):
+                outputs.final = index == len(self.handlers) - 1
+                # batch handlers expose the handler of a single event
+                handler = getattr(handler, "single", handler)
+                response = handler(event, context)
+                if inspect.isawaitable(response):
+                    response = asyncio.run(response)
+                event = response['body']
+        finally:
+            current_outputs.reset(token)
+            outputs.close()
+
+        return dict(response, pipeline=dict(local_downloads=outputs.local_downloads,
+                                            skipped_uploads=outputs.skipped_uploads))
@@ -0,0 +1,110 @@
+import functools
+import multiprocessing
+import os
+import traceback
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def run_in_processes(jobs: Sequence[Callable[[], T]], max_workers: Optional[int] = None) -> List[T]:
+    """Run `jobs` in forked processes, returning their (picklable) results in the order given.
+
+    At most `max_workers` processes (the number of CPUs if None) run at once. Only pipes are
+    used, as AWS Lambda has no `/dev/shm` for the semaphores of `multiprocessing.Pool`.
+    The first failing job terminates the others and its exception is re-raised.
+    Jobs run in this process if forking is not available.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1 or len(jobs) <= 1 or \
+            "fork" not in multiprocessing.get_all_start_methods():
+        return [job() for job in jobs]
+
+    context = multiprocessing.get_context("fork")
+    results: Dict[int, T] = {}
+    running: Dict[Any, Any] = {}
+    queued = list(enumerate(jobs))
+
+    try:
+        while queued or running:
+            while queued and len(running) < max_workers:
+                index, job = queued.pop(0)
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=_run_job, args=(job, sender), daemon=True)
+                process.start()
+                sender.close()
+                running[receiver] = (index, process)
+
+            for receiver in wait(list(running)):
+                index, process = running.pop(receiver)
+                try:
+                    ok, value = receiver.recv()
+                except EOFError:
+                    ok, value = False, None
+                receiver.close()
+                process.join()
+                if value is None and not ok:
+                    value = RuntimeError(
+                        f"Worker process exited with code {process.exitcode}")
+                if not ok:
+                    raise value
+                results[index] = value
+    finally:
+        for receiver, (_, process) in running.items():
+            process.terminate()
+            process.join()
+            receiver.close()
+
+    return [results[index] for index in range(len(jobs))]
+
+
+def _run_job(job: Callable[[], Any], sender) -> None:
+    try:
+        message = (True, job())
+    except BaseException as exc:
+        message = (False, exc)
+    try:
+        sender.send(message)
+    except Exception:
+        # result or exception cannot be pickled
+        sender.send((False, RuntimeError(traceback.format_exc())))
+    sender.close()
+
+
+def map_function(func: Callable[..., Any], args: Dict[str, Any], map_source: str,
+                 items: List[Dict[str, Any]], extra_return: Dict[str, Dict[str, Any]],
+                 max_workers: Optional[int] = None) -> None:
+    """
+    Call `func` once per path of list source `map_source`, in a process pool.
+
+    Each call gets the path of one item (with the other fields of the item as `<map_source>_<name>`),
+    and its own `*_args` dicts, merged into `extra_return` in the order of the items.
+    For a wildcard source, each file of its directory is an item, in sorted order.
+    """
+
+    paths = args[map_source]
+    if isinstance(paths, Path):
+        paths = sorted(path for path in paths.rglob("*") if path.is_file())
+        items = [{} for _ in paths]
+
+    def call(path, item):
+        item_args = dict(args)
+        item_args[map_source] = path
+        for name, val in item.items():
+            if name != 'Key':
+                item_args[f"{map_source}_{name}"] = val
+
+        item_return = {}
+        for key in extra_return:
+            item_args[f"{key}_args"] = item_return[key] = {}
+
+        func(**item_args)
+        return item_return
+
+    for item_return in run_in_processes([functools.partial(call, path, item)
+                                         for path, item in zip(paths, items)],
+                                        max_workers=max_workers):
+        for key, values in item_return.items():
+            extra_return[key].update(values)
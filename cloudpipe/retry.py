@@ -0,0 +1,238 @@
+import collections
+import functools
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .types import *
+
+TRANSIENT_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestTimeout",
+                   "RequestTimeTooSkewed", "InternalError", "ServiceUnavailable", "503", "500"}
+"Error codes of S3 responses worth retrying"
+
+TRANSIENT_ERRORS = {"EndpointConnectionError", "ConnectTimeoutError", "ReadTimeoutError",
+                    "ConnectionClosedError", "ResponseStreamingError"}
+"Names of botocore exceptions worth retrying (not imported, as botocore is optional)"
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether `exc` is a throttling, server or connection error, worth retrying"""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    if type(exc).__name__ in TRANSIENT_ERRORS:
+        return True
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return code in TRANSIENT_CODES or status in (500, 502, 503, 504)
+    return False
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retries with jittered exponential backoff, and hedged downloads, for `Downloader` and `Uploader`.
+
+    Retries are not started past the deadline of the invocation, taken from the Lambda
+    `context.get_remaining_time_in_millis()` less `deadline_margin`, and each attempt is awaited
+    until the deadline at most, raising `TimeoutError` then. The thread of an attempt past the
+    deadline is not interrupted, but the invocation no longer waits for it.
+    """
+
+    attempts: int = 4
+    "Attempts per transfer, including the first one"
+
+    base_delay: float = 0.1
+    "Seconds before the first retry, doubled for each further retry"
+
+    max_delay: float = 5.0
+
+    retryable: Callable[[BaseException], bool] = is_transient
+
+    deadline_margin: float = 1.0
+    "Seconds kept before the end of the invocation, for uploads and the response"
+
+    hedge_quantile: Optional[float] = None
+    """Issue a second (hedged) download when the first one is slower than this quantile of
+    recent downloads, e.g. 0.95, keeping the first to complete. Meant for steps with small
+    sources, as a hedge duplicates the transfer. Disabled if None."""
+
+    hedge_min_samples: int = 20
+    "Downloads observed before hedging"
+
+    hedge_max_bytes: Optional[int] = None
+    """Downloads of objects larger than this (by the `object_size` of the storage, a HEAD request)
+    or of unknown size are not hedged. All sizes are hedged if None."""
+
+    latencies: Deque[float] = field(
+        default_factory=lambda: collections.deque(maxlen=200), init=False, repr=False)
+    "Seconds of recent downloads, across invocations"
+
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def start(self, context: Any = None, max_workers: int = 1) -> "ResilientTransfers":
+        """Transfers of one invocation, with up to `max_workers` concurrent transfers"""
+        deadline = None
+        if remaining := getattr(context, "get_remaining_time_in_millis", None):
+            deadline = time.monotonic() + remaining() / 1e3 - self.deadline_margin
+        return ResilientTransfers(policy=self, deadline=deadline, max_workers=max_workers)
+
+    def backoff(self, retry: int) -> float:
+        # "full jitter", spreading the retries of concurrent transfers
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def hedge_after(self) -> Optional[float]:
+        """Seconds after which a download is hedged, None if not (yet) hedging"""
+        if self.hedge_quantile is None:
+            return None
+        with self._lock:
+            if len(self.latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+
+_attempt_pools: Dict[int, ThreadPoolExecutor] = {}
+_attempt_pools_lock = threading.Lock()
+
+
+def _attempt_pool(max_workers: int) -> ThreadPoolExecutor:
+    """Pool shared by invocations with `max_workers` concurrent transfers, each with up to two attempts"""
+    with _attempt_pools_lock:
+        if (pool := _attempt_pools.get(max_workers)) is None:
+            pool = _attempt_pools[max_workers] = ThreadPoolExecutor(
+                2 * max(1, max_workers), thread_name_prefix="cloudpipe-attempt")
+        return pool
+
+
+@dataclass
+class ResilientTransfers:
+    """Wraps the transfers of one invocation, counting retries and hedges"""
+
+    policy: RetryPolicy
+    deadline: Optional[float] = None
+    "`time.monotonic()` after which no retry is started, nor attempt awaited"
+
+    max_workers: int = 1
+    "Concurrent transfers of the invocation, sizing the pool of attempts bounded by `deadline`"
+
+    counts: Dict[str, int] = field(default_factory=lambda: dict(
+        download_retries=0, upload_retries=0, hedged=0, hedge_wins=0))
+
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def downloader(self, downloader: Downloader, object_size: Optional[ObjectSize] = None) -> Downloader:
+        def download(Key: str, Filename: str, **kwargs):
+            hedged = functools.partial(self.hedged, object_size=object_size)
+            return self.call("download_retries", hedged, downloader, Key=Key, Filename=Filename, **kwargs)
+        return download
+
+    def uploader(self, uploader: Uploader) -> Uploader:
+        def upload(Key: str, Filename: str, **kwargs):
+            return self.call("upload_retries", self.bounded, uploader, Key=Key, Filename=Filename, **kwargs)
+        return upload
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def call(self, counter: str, attempt: Callable[..., Any], transfer: Callable[..., Any], **kwargs):
+        retry = 0
+        while True:
+            try:
+                return attempt(transfer, **kwargs)
+            except Exception as exc:
+                if retry + 1 >= self.policy.attempts or not self.policy.retryable(exc):
+                    raise
+                delay = self.policy.backoff(retry)
+                if self.deadline is not None and time.monotonic() + delay > self.deadline:
+                    raise
+                self.count(counter)
+                retry += 1
+                time.sleep(delay)
+
+    def bounded(self, transfer: Callable[..., Any], **kwargs) -> Any:
+        """Run `transfer`, waiting for it until the deadline at most"""
+        if self.deadline is None:
+            return transfer(**kwargs)
+        future = _attempt_pool(self.max_workers).submit(transfer, **kwargs)
+        done, _ = wait([future], timeout=max(0.0, self.deadline - time.monotonic()))
+        if not done:
+            raise TimeoutError(f"Transfer of {kwargs.get('Key')} did not complete before the deadline")
+        return future.result()
+
+    def hedged(self, downloader: Downloader, Key: str, Filename: str,
+               object_size: Optional[ObjectSize] = None, **kwargs) -> None:
+        start = time.monotonic()
+        if (hedge_after := self.policy.hedge_after()) is not None and self.policy.hedge_max_bytes is not None:
+            size = object_size(Key) if object_size else None
+            if size is None or size > self.policy.hedge_max_bytes:
+                hedge_after = None
+        if hedge_after is None:
+            self.bounded(downloader, Key=Key, Filename=Filename, **kwargs)
+            self.policy.observe(time.monotonic() - start)
+            return
+
+        def attempt() -> str:
+            # each attempt to its own file, the first to complete is kept
+            part = f"{Filename}.{uuid.uuid4().hex}.part"
+            try:
+                downloader(Key=Key, Filename=part, **kwargs)
+            except BaseException:
+                # failed attempts may leave partial content
+                _unlink(part)
+                raise
+            return part
+
+        pool = _attempt_pool(self.max_workers)
+        futures: List[Future] = [pool.submit(attempt)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            self.count("hedged")
+            futures.append(pool.submit(attempt))
+
+        timeout = None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+        pending = set(futures)
+        winner = error = None
+        while pending and winner is None:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"Download of {Key} did not complete before the deadline")
+            for future in done:
+                if future.exception() is None:
+                    winner = winner or future
+                else:
+                    error = error or future.exception()
+
+        for future in futures:
+            if future is not winner:
+                future.add_done_callback(_discard_part)
+        if winner is None:
+            raise error
+
+        if winner is not futures[0]:
+            self.count("hedge_wins")
+        os.replace(winner.result(), Filename)
+        self.policy.observe(time.monotonic() - start)
+
+
+def _discard_part(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        _unlink(future.result())
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
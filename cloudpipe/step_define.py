@@ -1,15 +1,26 @@
-import atexit
+import contextlib
 import functools
-import shutil
-import tempfile
+import inspect
+import uuid
 import warnings
 from dataclasses import dataclass, field
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from typing import Dict, Optional, Union
 
+from .aio import AsyncEventFSMap
+from .batch import run_batch
+from .compression import get_codec
 from .init_cloud import default_assume, in_cloud, new_storage
 from .main import *
+from .memo import memoize as memoized_handler
+from .metrics import InvocationMetrics, phase
+from .pipeline import current_outputs
+from .processes import map_function
+from .retry import ResilientTransfers, RetryPolicy
+from .stream import EventStreamMap
+from .template import compile_templates
 from .types import *
+from .workspace import Workspace
 
 
 @dataclass
@@ -26,11 +37,24 @@ class Step:
             Process keys which should be copied into list file outputs (for wildcard paths).
         more_info: INFO_FROM_PATH
             Callable for getting additional return info, given path
+        batch: bool
+            Handler receives a batch of events (SQS `Records`, Step Functions `Items` or a list),
+            and returns per item `results` and `batchItemFailures`
+        map_source: str
+            List source (a list of `{"key": ...}` in the event, whose path includes `{file}`)
+            or wildcard source, over which the function is mapped in a process pool of
+            `max_map_workers`, each call getting the path of one item (of one listed object
+            for a wildcard source). Destinations must be wildcards. Not supported with
+            `streaming` or `lazy_sources`.
+
+    Functions defined with `async def` give an `async def` handler, with transfers awaited
+    concurrently (see `async_downloader`).
 
     Parameters of functions to be decorated:
 
         argument 1..N : pathlib.Path
-            Includes both `source` and `destn` arguments (as in decorator definition)
+            Includes both `source` and `destn` arguments (as in decorator definition).
+            Binary streams instead, if `streaming`
         argument_var : Union[dict, str]
             Additional info var
         argument_args : Dict[str, Any] (output)
@@ -40,7 +64,8 @@ class Step:
 
     location_env_key: CLOUD_STORE = field(default_factory=dict)
     """Environment variable containing the storage name (e.g. s3 bucket name).
-    If not found it will directly be used as the storage name."""
+    If not found it will directly be used as the storage name.
+    `local` (a directory) and `memory` (a store name) take precedence over `s3`."""
 
     arg_override_location_env_key: Dict[str, CLOUD_STORE] = \
         field(default_factory=dict)
@@ -48,7 +73,11 @@ class Step:
     Will be used only for downloading."""
 
     local: Optional[Union[Path, str]] = None
-    """Path for storing data locally. If not provided, will create a temporary space."""
+    """Path for storing data locally. If not provided, each invocation uses a scratch
+    directory from `workspace`, which is cleaned once the invocation completes."""
+
+    workspace: Workspace = field(default_factory=Workspace)
+    """Recycled scratch space and disk budget for invocations"""
 
     in_cloud: Optional[bool] = field(default=None)
     """False => do not use cloud storage (override with `downloader` or `uploader`)
@@ -61,7 +90,8 @@ class Step:
 
     arg_override_downloader: Dict[str, Downloader] = \
         field(default_factory=dict)
-    storage: CloudStoreBase = field(init=False)
+    storage: Optional[CloudStoreBase] = None
+    """Storage for transfers, e.g. a `LocalStorage` or `MemoryStorage`. Created from `location_env_key` if not provided."""
 
     save_prefix: str = field(default="")
     "Fixed prefix for uploaded files"
@@ -69,95 +99,395 @@ class Step:
     more_info: INFO_FROM_PATH = None
     """Callable to gather additional info for each file being uploaded"""
 
+    transfer_config: Dict[str, Any] = field(default_factory=dict)
+    """Tuning of file transfers by the storage, for S3 the arguments of `boto3.s3.transfer.TransferConfig`
+    (e.g. multipart_threshold, multipart_chunksize, max_concurrency)"""
+
+    large_objects: Dict[str, Any] = field(default_factory=dict)
+    """Resumable, checksummed transfers for large objects, for S3 the arguments of
+    `cloudpipe.multipart.LargeObjectTransfer` (e.g. threshold, part_size, checksum)"""
+
+    max_download_workers: int = 1
+    """Number of source files downloaded concurrently. Remaining downloads are
+    cancelled on the first failure."""
+
+    max_upload_workers: int = 1
+    """Number of destination files (including each wildcard match) uploaded concurrently."""
+
+    download_cache: Optional[DownloadCache] = None
+    """Keep downloaded sources across invocations of a warm container.
+    Only used for sources whose storage provides a `fingerprint`."""
+
+    fingerprint: Optional[Fingerprint] = None
+    """Identify the content of a source key for `download_cache`. Taken from the storage if not provided."""
+
+    arg_override_fingerprint: Dict[str, Fingerprint] = \
+        field(default_factory=dict)
+
+    streaming: bool = False
+    """Pass sources and destinations to the function as binary streams instead of paths,
+    without using the local file system. Wildcard destinations are not supported."""
+
+    max_batch_workers: int = 1
+    """Number of items of a batch event (see `batch`) processed concurrently"""
+
+    lazy_sources: bool = False
+    """Download each source only when the function first accesses its path.
+    Sources which were downloaded are listed in the response under `fetched`."""
+
+    memoize: bool = False
+    """Skip download and execution when the event, the content of its sources (per storage `fingerprint`)
+    and `code_version` match the manifest stored with the outputs of a previous completed run."""
+
+    code_version: str = ""
+    "Version of the step code, change it to invalidate `memoize` manifests"
+
+    metrics: Optional[MetricsExporter] = None
+    """Receives the phase timings and transfers of each invocation, e.g. an `EMFExporter`
+    or a `MemoryCollector`. Nothing is measured if not provided."""
+
+    lister: Optional[Lister] = None
+    """Lists the objects of wildcard sources, e.g. `{doc}/pages/*.png` given `{"prefix": "pages/doc/"}`
+    in the event, which are downloaded (by `max_download_workers`) into the directory passed to the function.
+    Taken from the storage if not provided."""
+
+    arg_override_lister: Dict[str, Lister] = \
+        field(default_factory=dict)
+
+    stream_downloader: Optional[StreamDownloader] = None
+    stream_uploader: Optional[StreamUploader] = None
+
+    arg_override_stream_downloader: Dict[str, StreamDownloader] = \
+        field(default_factory=dict)
+
+    retry: Optional[RetryPolicy] = None
+    """Retry transient transfer errors (e.g. S3 SlowDown) with backoff within the remaining time of the
+    invocation, which also bounds the wait for each attempt, and optionally hedge slow downloads. Retries and hedges are counted in the response under
+    `retries`. Streaming transfers are not retried."""
+
+    object_size: Optional[ObjectSize] = None
+    "Size of a source key, for `RetryPolicy.hedge_max_bytes`. Taken from the storage if not provided."
+
+    arg_override_object_size: Dict[str, ObjectSize] = \
+        field(default_factory=dict)
+
+    dedup_uploads: bool = False
+    """Skip uploading outputs identical (by SHA256) to the stored object, e.g. on re-runs. Requires a storage
+    providing `content_hash`, whose uploader stores the hash. Skipped uploads are reported under `deduplicated`."""
+
+    content_hash: Optional[ContentHash] = None
+    "Stored SHA256 of a key, for `dedup_uploads`. Taken from the storage if not provided."
+
+    compress: Dict[str, str] = field(default_factory=dict)
+    """Codec (`gzip`, `zstd` if the `zstandard` package is installed, or `none`) by destination name.
+    Outputs are compressed on upload, their keys suffixed (e.g. `.gz`) and their `Content-Type` set (e.g.
+    `application/gzip`, without `Content-Encoding`, so that HTTP clients do not decompress them on the fly),
+    and the codec returned with each key, so that following steps decompress them."""
+
+    decompress: Dict[str, str] = field(default_factory=dict)
+    """Codec by source name, `auto` for the suffix of the key. Sources are decompressed once downloaded,
+    into their path without the suffix. The `codec` given with a source in the event takes precedence."""
+
+    watch_outputs: Optional[float] = None
+    """Seconds between scans of wildcard destinations while the function runs. Files unchanged
+    between two scans are uploaded in the background, overlapping uploads with the function.
+    None uploads all files once the function returns. The returned list is the same either way:
+    objects of files deleted or renamed after their background upload are removed with `deleter`
+    (left in the storage, with a warning, if there is none). Not supported by `async def` functions."""
+
+    deleter: Optional[Deleter] = None
+    "Removes stale background uploads of `watch_outputs`. Taken from the storage if not provided."
+
+    spill_lists: Optional[int] = None
+    """Responses larger than this many bytes (as JSON, e.g. `PAYLOAD_LIMIT`) have the lists of wildcard
+    destinations uploaded as JSON Lines under `<save_prefix>/_manifest/`, and replaced by
+    `{"manifest": {"key": ..., "count": ...}}`. Lists are always returned in full if None."""
+
+    max_map_workers: Optional[int] = None
+    "Processes running the function for `map_source`, the number of CPUs if None"
+
+    async_downloader: Optional[AsyncDownloader] = None
+    """Used by `async def` functions. Taken from the storage if provided there, otherwise
+    `downloader` runs in the executor of the event loop."""
+
+    async_uploader: Optional[AsyncUploader] = None
+
+    max_async_transfers: int = 64
+    "Transfers in flight at once, for `async def` functions"
+
     def __post_init__(self):
-        if self.local is None:
-            self.local = Path(tempfile.mkdtemp())
-            atexit.register(lambda:
-                            shutil.rmtree(self.local, ignore_errors=True))
+        if self.workspace.cache is None:
+            self.workspace.cache = self.download_cache
 
         if self.in_cloud is not False:
-            new_storage_call = {}
-            self.storage = new_storage(
-                self.location_env_key, **new_storage_call)
+            # partial downloads under the workspace, counted in its disk budget
+            large_objects = dict(dict(partial_dir=self.workspace.partial_dir), **self.large_objects) \
+                if self.large_objects else {}
+            new_storage_call = dict(transfer_config=self.transfer_config,
+                                    large_objects=large_objects)
+            if self.storage is None:
+                self.storage = new_storage(
+                    self.location_env_key, **new_storage_call)
             if (not self.storage) and (self.in_cloud is None):
-                new_storage_call = {default_assume: True}
+                new_storage_call[default_assume] = True
                 self.storage = new_storage(self.location_env_key,
                                            **new_storage_call)
             if self.storage:
                 for arg, store in self.arg_override_location_env_key.items():
                     if store := new_storage(store, **new_storage_call):
                         self.arg_override_downloader[arg] = store.downloader
+                        if fingerprint := getattr(store, "fingerprint", None):
+                            self.arg_override_fingerprint.setdefault(
+                                arg, fingerprint)
+                        if lister := getattr(store, "list_keys", None):
+                            self.arg_override_lister.setdefault(arg, lister)
+                        if object_size := getattr(store, "object_size", None):
+                            self.arg_override_object_size.setdefault(arg, object_size)
+                        if opener := getattr(store, "open_reader", None):
+                            self.arg_override_stream_downloader.setdefault(
+                                arg, opener)
                 self.downloader = self.storage.downloader
+                if self.fingerprint is None:
+                    self.fingerprint = getattr(
+                        self.storage, "fingerprint", None)
                 self.uploader = self.storage.uploader
+                if self.lister is None:
+                    self.lister = getattr(self.storage, "list_keys", None)
+                if self.content_hash is None:
+                    self.content_hash = getattr(
+                        self.storage, "content_hash", None)
+                if self.object_size is None:
+                    self.object_size = getattr(
+                        self.storage, "object_size", None)
+                if self.deleter is None:
+                    self.deleter = getattr(self.storage, "delete", None)
+                if self.stream_downloader is None:
+                    self.stream_downloader = getattr(
+                        self.storage, "open_reader", None)
+                if self.stream_uploader is None:
+                    self.stream_uploader = getattr(
+                        self.storage, "open_writer", None)
+                if self.async_downloader is None:
+                    self.async_downloader = getattr(
+                        self.storage, "async_downloader", None)
+                if self.async_uploader is None:
+                    self.async_uploader = getattr(
+                        self.storage, "async_uploader", None)
         else:
             if self.downloader is None:
                 self.downloader = DummyDownloader
             if self.uploader is None:
                 self.uploader = DummyUploader
 
+    @property
+    def cache_hits(self) -> int:
+        return self.download_cache.hits if self.download_cache else 0
+
+    @property
+    def cache_misses(self) -> int:
+        return self.download_cache.misses if self.download_cache else 0
+
     def __call__(self, source: MAP_SOURCE, destn: MAP_DESTN = None,
                  list_copy_keys: List[str] = None,
                  more_info: INFO_FROM_PATH = None,
                  pass_event_as: str = None,
+                 batch: bool = False,
+                 map_source: str = None,
                  **kwargs):
 
-        multi_saves: List[str] = []
         if destn is None:
             destn = {}
 
-        def modifier(func):
+        # parsed and validated once, at decoration time
+        source = compile_templates(source)
+        destn = compile_templates(destn)
 
-            if self.in_cloud is not False:
-                @functools.wraps(func)
-                def handler(event, context):
-                    with EventFSMap(
-                        event=event,
-                        source=source, destn=destn, root=self.local,
-                        downloader=self.downloader, uploader=self.uploader,
-                        arg_override_downloader=self.arg_override_downloader,
+        multi_saves = [key for key, path in destn.items() if path.is_wild]
+        if self.streaming and multi_saves:
+            raise ValueError(
+                f"Wildcard destinations {multi_saves} cannot be used with `streaming`")
+        # validated at decoration time
+        destn_codecs = {key: codec for key, codec in self.compress.items() if get_codec(codec)}
+        for codec in self.decompress.values():
+            if codec != "auto":
+                get_codec(codec)
+        if self.streaming and (self.compress or self.decompress):
+            raise ValueError("`compress` and `decompress` cannot be used with `streaming`")
+
+        if self.dedup_uploads and self.in_cloud is not False and self.content_hash is None:
+            raise ValueError("`dedup_uploads` requires a storage providing `content_hash`")
+        if self.streaming and self.dedup_uploads:
+            raise ValueError("`dedup_uploads` cannot be used with `streaming`")
+        if self.streaming and (multi_sources := [key for key, path in source.items() if path.is_wild]):
+            raise ValueError(
+                f"Wildcard sources {multi_sources} cannot be used with `streaming`")
+
+        if map_source:
+            if map_source not in source:
+                raise ValueError(f"`map_source` {map_source} is not a source")
+            if not source[map_source].is_wild and "file" not in source[map_source].names:
+                raise ValueError(
+                    f"`map_source` {map_source} must be a wildcard source, or a list source whose path includes {{file}}")
+            for option in ("streaming", "lazy_sources"):
+                # lazy sources would be fetched by the worker processes, unknown to the handler
+                if getattr(self, option):
+                    raise ValueError(f"`{option}` cannot be used with `map_source`")
+            if single_saves := [key for key, path in destn.items() if not path.is_wild]:
+                raise ValueError(
+                    f"Destinations {single_saves} would be written by every call of `map_source`, use wildcards")
+
+        def function_args(event, context, fsmap):
+            args = dict(context=context)
+
+            if pass_event_as:
+                args[pass_event_as] = event
+
+            for key in source:
+                args[key] = fsmap[key]
+                if isinstance(evparam := event.get(key, {}), dict):
+                    for name, val in evparam.items():
+                        if name != 'Key':
+                            args[f"{key}_{name}"] = val
+
+            extra_retn = {}
+
+            for key in destn:
+                key2 = key
+                if key in args:
+                    key2 += "_save"
+                args[key2] = fsmap['_save'][key]
+
+                args[f"{key2}_args"] = extra_retn[key2] = {}
+
+            return args, extra_retn
+
+        def respond(func, event, fsmap, remotemap, extra_retn, invocation, transfers):
+            with phase(invocation, "response"):
+                body = return_body(event=event, s3map=remotemap,
+                                   list_keys=multi_saves,
+                                   extra_return=extra_retn,
+                                   additional_info=more_info, key_copy=list_copy_keys,
+                                   codecs=destn_codecs)
+                if invocation or self.spill_lists is not None:
+                    size = payload_size(body)
+                    if self.spill_lists is not None and size > self.spill_lists and multi_saves:
+                        name = (event.get('document') or {}).get('name') or uuid.uuid4().hex
+                        spill_lists(body, multi_saves, self.uploader,
+                                    lambda listed: str(PurePosixPath(self.save_prefix or "") / "_manifest" /
+                                                       func.__name__ / name / f"{listed}.jsonl"))
+                        size = payload_size(body)
+                    if invocation:
+                        invocation.count("response_bytes", size)
+                    if size > PAYLOAD_LIMIT:
+                        warnings.warn(
+                            f"Response of {func.__name__} is {size} bytes, over the payload limit of {PAYLOAD_LIMIT}")
+                response = {'statusCode': '200', 'body': body}
+            if self.lazy_sources:
+                response['fetched'] = list(fsmap['_fetched'])
+            if self.dedup_uploads:
+                response['deduplicated'] = dict(count=len(fsmap['_deduplicated']),
+                                                bytes_saved=sum(size for _, size in fsmap['_deduplicated']))
+            if transfers:
+                response['retries'] = dict(transfers.counts)
+                if invocation:
+                    for name, value in transfers.counts.items():
+                        invocation.count(name, value)
+            if invocation:
+                self.metrics(invocation.as_dict())
+            return response
+
+        def map_options(func, transfers: Optional[ResilientTransfers]):
+            downloader, uploader = self.downloader, self.uploader
+            arg_override_downloader = self.arg_override_downloader
+            if transfers:
+                downloader = transfers.downloader(downloader, self.object_size)
+                uploader = transfers.uploader(uploader)
+                arg_override_downloader = {
+                    arg: transfers.downloader(override, self.arg_override_object_size.get(arg))
+                    for arg, override in arg_override_downloader.items()}
+
+            return dict(source=source, destn=destn,
+                        downloader=downloader, uploader=uploader,
+                        arg_override_downloader=arg_override_downloader,
+                        lister=self.lister,
+                        arg_override_lister=self.arg_override_lister,
                         require_save_prefix=self.save_prefix,
-                        **kwargs) \
-                            as (fsmap, remotemap):
+                        download_cache=self.download_cache,
+                        fingerprint=self.fingerprint,
+                        arg_override_fingerprint=self.arg_override_fingerprint,
+                        deleter=self.deleter,
+                        metrics=InvocationMetrics(
+                            function=func.__name__) if self.metrics else None,
+                        fused_outputs=current_outputs.get(),
+                        content_hash=self.content_hash if self.dedup_uploads else None,
+                        compress=self.compress, decompress=self.decompress,
+                        **kwargs)
 
-                        args = dict(context=context)
+        def modifier(func):
+            decorated = decorate(func)
+            # for drivers running the handler outside of the cloud, e.g. `cloudpipe.backfill`
+            decorated.step = self
+            return decorated
 
-                        if pass_event_as:
-                            args[pass_event_as] = event
+        def decorate(func):
 
-                        for key in source:
-                            args[key] = fsmap[key]
-                            if evparam := event.get(key, {}):
-                                for name, val in evparam.items():
-                                    if name != 'Key':
-                                        args[f"{key}_{name}"] = val
+            if inspect.iscoroutinefunction(func):
+                return self.async_handler(func, function_args, respond, map_options, batch, map_source)
 
-                        extra_retn = {}
+            if self.in_cloud is not False:
+                def handler(event, context):
+                    if map_source and not source[map_source].is_wild and \
+                            not isinstance(event.get(map_source), list):
+                        raise ValueError(f"`map_source` {map_source} must be a list in the event")
+                    if self.streaming:
+                        mapper = functools.partial(
+                            EventStreamMap,
+                            stream_downloader=self.stream_downloader,
+                            stream_uploader=self.stream_uploader,
+                            arg_override_stream_downloader=self.arg_override_stream_downloader)
+                        scratch = contextlib.nullcontext(None)
+                    else:
+                        mapper = EventFSMap
+                        scratch = self.workspace.scratch(self.local)
+
+                    transfers = self.retry.start(context, max(self.max_download_workers, self.max_upload_workers)) \
+                        if self.retry else None
+                    options = map_options(func, transfers)
+                    invocation = options['metrics']
 
-                        for key, path in destn.items():
-                            key2 = key
-                            if key in args:
-                                key2 += "_save"
-                            args[key2] = fsmap['_save'][key]
+                    with scratch as root, mapper(
+                        event=event, root=root,
+                        max_download_workers=self.max_download_workers,
+                        max_upload_workers=self.max_upload_workers,
+                        lazy_sources=self.lazy_sources,
+                        watch_outputs=self.watch_outputs,
+                        **options) \
+                            as (fsmap, remotemap):
 
-                            args[f"{key2}_args"] = extra_retn[key2] = {}
+                        args, extra_retn = function_args(event, context, fsmap)
 
-                            if path_is_wild(path):
-                                multi_saves.append(key)
+                        with phase(invocation, "execute"):
+                            if map_source:
+                                map_function(func, args, map_source, event[map_source],
+                                             extra_return=extra_retn,
+                                             max_workers=self.max_map_workers)
+                            else:
+                                func(**args)
 
-                        func(**args)
+                    return respond(func, event, fsmap, remotemap, extra_retn, invocation, transfers)
 
-                    self.local = Path(tempfile.mkdtemp())
-                    atexit.register(lambda:
-                                    shutil.rmtree(self.local, ignore_errors=True))
+                if self.memoize:
+                    handler = memoized_handler(
+                        handler, step=self, name=func.__name__, source=source, destn=destn)
 
-                    return {
-                        'statusCode': '200',
-                        'body': return_body(event=event, s3map=remotemap,
-                                            list_keys=multi_saves,
-                                            extra_return=extra_retn,
-                                            additional_info=more_info, key_copy=list_copy_keys)
-                    }
-                return handler
+                if batch:
+                    @functools.wraps(func)
+                    def batch_handler(event, context):
+                        return run_batch(handler, event, context,
+                                         max_workers=self.max_batch_workers)
+                    batch_handler.single = handler
+                    return batch_handler
+                return functools.wraps(func)(handler)
             else:
                 @functools.wraps(func)
                 def dummy(*args, **kwargs):
@@ -168,3 +498,52 @@ class Step:
                     func(*args, **kwargs)
                 return dummy
         return modifier
+
+    def async_handler(self, func, function_args, respond, map_options, batch: bool, map_source: Optional[str]):
+        """`async def` handler of coroutine function `func`"""
+
+        for option in ("streaming", "lazy_sources", "memoize"):
+            if getattr(self, option):
+                raise ValueError(
+                    f"`{option}` cannot be used with `async def` function {func.__name__}")
+        if self.watch_outputs is not None:
+            raise ValueError(
+                f"`watch_outputs` cannot be used with `async def` function {func.__name__}")
+        if batch:
+            raise ValueError(
+                f"`batch` cannot be used with `async def` function {func.__name__}")
+        if map_source:
+            raise ValueError(
+                f"`map_source` cannot be used with `async def` function {func.__name__}")
+
+        if self.in_cloud is False:
+            @functools.wraps(func)
+            async def dummy(*args, **kwargs):
+                return await func(*args, **kwargs)
+            return dummy
+
+        @functools.wraps(func)
+        async def handler(event, context):
+            transfers = self.retry.start(context, max(self.max_download_workers, self.max_upload_workers)) \
+                if self.retry else None
+            options = map_options(func, transfers)
+            invocation = options['metrics']
+
+            with self.workspace.scratch(self.local) as root:
+                async with AsyncEventFSMap(
+                    event=event, root=root,
+                    # transfers with retries run in the executor
+                    async_downloader=None if transfers else self.async_downloader,
+                    async_uploader=None if transfers else self.async_uploader,
+                    max_concurrency=self.max_async_transfers,
+                    **options) \
+                        as (fsmap, remotemap):
+
+                    args, extra_retn = function_args(event, context, fsmap)
+
+                    with phase(invocation, "execute"):
+                        await func(**args)
+
+            return respond(func, event, fsmap, remotemap, extra_retn, invocation, transfers)
+
+        return handler
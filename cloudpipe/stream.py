@@ -0,0 +1,90 @@
+from dataclasses import dataclass, field
+from pathlib import PurePath
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Type
+
+from .main import EventFSMap
+from .metrics import phase
+from .types import *
+
+
+@dataclass
+class EventStreamMap(EventFSMap):
+    """
+    Variant of `EventFSMap` which does not use the local file system.
+
+    Sources are mapped to readable streams, fetched as they are read, and
+    destinations to writable streams which are stored when the mapping exits
+    (and discarded if an exception was raised). Wildcard destinations and list sources
+    are not supported.
+    """
+
+    stream_downloader: StreamDownloader = field(default=None)
+    stream_uploader: StreamUploader = field(default=None)
+
+    arg_override_stream_downloader: Dict[str, StreamDownloader] = \
+        field(default_factory=dict)
+
+    writers: Dict[str, Tuple[str, BinaryIO]] = field(init=False)
+
+    def __post_init__(self) -> None:
+
+        self.root = PurePath(self.root or "")
+
+        self.fetched = []
+        self.source_locations = {'_root': self.root, '_fetched': self.fetched}
+
+        self.prepare_names()
+
+        if list_sources := [name for name in self.source if isinstance(self.event.get(name), list)]:
+            raise ValueError(f"List sources {list_sources} cannot be streamed")
+
+        for source_name, s3_args in self.iter_fs_maps(map_=self.source, event=self.event, create_path=False,
+                                                      ignore_missing_keys=self.ignore_missing_source):
+            opener = self.arg_override_stream_downloader.get(
+                source_name, self.stream_downloader)
+            self.source_locations[source_name] = opener(Key=s3_args['Key'])
+
+        self.destn_rendered = {key: template.render(self.current_names)
+                               for key, template in self.destn.items()}
+
+        self.writers = {}
+        for key, file_path in self.destn_rendered.items():
+            if self.destn[key].is_wild:
+                raise ValueError(
+                    f"Wildcard destination {key}: {file_path} cannot be streamed")
+            upload_key = str(self.destn_key(key, file_path))
+            self.writers[key] = (upload_key, self.stream_uploader(Key=upload_key))
+
+        self.source_locations['_save'] = {
+            key: writer for key, (_, writer) in self.writers.items()}
+
+    def __exit__(self,
+                 exc_type: Optional[Type[BaseException]],
+                 exc_val: Optional[BaseException],
+                 exc_tb) -> None:
+
+        for name in self.source:
+            if reader := self.source_locations.get(name):
+                reader.close()
+
+        with phase(self.metrics, "upload"):
+            pending = list(self.writers.items())
+            try:
+                while pending:
+                    key, (upload_key, writer) = pending.pop(0)
+                    nothing_written = writer.tell() == 0 and key in self.ignore_missing_destn
+                    if exc_type or nothing_written:
+                        abort_writer(writer)
+                        continue
+                    writer.close()
+                    self.all_uploads[key] = dict(key=upload_key)
+            finally:
+                # a failed close leaves the remaining writers uncommitted
+                for _, (_, writer) in pending:
+                    abort_writer(writer)
+
+
+def abort_writer(writer: BinaryIO) -> None:
+    # writers without `abort` are left open, as closing would store them
+    if abort := getattr(writer, "abort", None):
+        abort()
@@ -0,0 +1,71 @@
+import functools
+import string
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+TEMPLATE_NAMES = ("doc", "file", "page", "pagenum", "header_index")
+"Names available in path templates"
+
+WILDCARDS = ("*", "?")
+
+
+class PathTemplate:
+    """
+    Path template of `source` or `destn`, e.g. `{doc}/output/*.jpeg`, parsed once.
+
+    Unknown names raise `ValueError` when compiled, rather than `KeyError` when rendered.
+    """
+
+    __slots__ = ("template", "names", "is_wild", "_parts", "_simple")
+
+    def __init__(self, template: str, allowed: Tuple[str, ...] = TEMPLATE_NAMES):
+        self.template = template
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        self._simple = True
+        names = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+            if field_name is not None:
+                name = field_name.split(".", 1)[0].split("[", 1)[0]
+                if name not in allowed:
+                    raise ValueError(
+                        f"Unknown name {{{name}}} in path template {template!r}, expected one of {allowed}")
+                names.append(name)
+                if format_spec or conversion or name != field_name:
+                    self._simple = False
+            self._parts.append((literal, field_name))
+        self.names = tuple(names)
+        self.is_wild = any(char in literal for literal, _ in self._parts
+                           for char in WILDCARDS)
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def compile(cls, template: Union[str, "PathTemplate"]) -> "PathTemplate":
+        if isinstance(template, PathTemplate):
+            return template
+        return cls(template)
+
+    def render(self, names: Mapping[str, object]) -> str:
+        if not self._simple:
+            return self.template.format(**names)
+        return "".join(literal if field_name is None else literal + str(names[field_name])
+                       for literal, field_name in self._parts)
+
+    def format(self, **names) -> str:
+        return self.render(names)
+
+    def __str__(self) -> str:
+        return self.template
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.template!r})"
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PathTemplate):
+            other = other.template
+        return self.template == other
+
+    def __hash__(self) -> int:
+        return hash(self.template)
+
+
+def compile_templates(map_: Mapping[str, Union[str, PathTemplate]]) -> Dict[str, PathTemplate]:
+    return {key: PathTemplate.compile(template) for key, template in map_.items()}
@@ -0,0 +1,27 @@
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def run_transfers(jobs: Sequence[Callable[[], T]], max_workers: int = 1) -> List[T]:
+    """Run transfer `jobs`, returning their results in the order given.
+
+    With `max_workers` > 1 the jobs run on a thread pool. The first failing job
+    cancels every transfer which has not started yet and its exception is re-raised.
+    """
+    if max_workers <= 1 or len(jobs) <= 1:
+        return [job() for job in jobs]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = [pool.submit(job) for job in jobs]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        if pending:
+            for future in pending:
+                future.cancel()
+            # transfers already running cannot be interrupted, let them finish
+            wait(pending)
+        for future in futures:
+            if not future.cancelled() and future.exception():
+                raise future.exception()
+        return [future.result() for future in futures]
@@ -1,13 +1,15 @@
 from pathlib import Path, PurePath
-from typing import List, Dict, Optional, Protocol, Type, Tuple, TypedDict, Any, Callable
+from typing import List, Dict, Optional, Protocol, Type, Tuple, TypedDict, Any, Callable, BinaryIO, Iterable, Iterator
 
 MAP_SOURCE = Dict[str, str]
 MAP_DESTN = Dict[str, str]
 
 SOURCE_LOCATIONS = TypedDict(
-    "SOURCE_LOCATIONS", {"_root": Path, "_save": Dict[str, Path]}, total=False)
+    "SOURCE_LOCATIONS", {"_root": Path, "_save": Dict[str, Path], "_fetched": List[str],
+                         "_deduplicated": List[Tuple[str, int]]}, total=False)
 
-CLOUD_STORE = TypedDict("CLOUD_LOCATIONS", {'s3': str})
+CLOUD_STORE = TypedDict(
+    "CLOUD_LOCATIONS", {'s3': str, 'local': str, 'memory': str}, total=False)
 
 
 class Downloader(Protocol):
@@ -15,11 +17,72 @@ class Downloader(Protocol):
 
 
 class Uploader(Protocol):
+    """Storages may also accept `Sha256` and `ContentType` keywords, used by
+    `Step.dedup_uploads` and `Step.compress`"""
+
     def __call__(self, Key: str, Filename: str) -> None: ...
 
 
+class AsyncDownloader(Protocol):
+    async def __call__(self, Key: str, Filename: str) -> None: ...
+
+
+class AsyncUploader(Protocol):
+    async def __call__(self, Key: str, Filename: str) -> None: ...
+
+
+class Lister(Protocol):
+    """Keys of the objects starting with `Prefix`, in lexicographic order"""
+
+    def __call__(self, Prefix: str) -> Iterable[str]: ...
+
+
+class StreamDownloader(Protocol):
+    """Open `Key` as a readable binary stream"""
+
+    def __call__(self, Key: str) -> BinaryIO: ...
+
+
+class StreamUploader(Protocol):
+    """Open `Key` as a writable binary stream, stored once the stream is closed"""
+
+    def __call__(self, Key: str) -> BinaryIO: ...
+
+
+class ContentHash(Protocol):
+    """SHA256 (hex) of the stored content of `Key`, as given to the `Sha256` argument of uploaders
+    supporting it. None if unknown."""
+
+    def __call__(self, Key: str) -> Optional[str]: ...
+
+
+class Deleter(Protocol):
+    """Delete the stored `Key`, if it exists"""
+
+    def __call__(self, Key: str) -> None: ...
+
+
+class ObjectSize(Protocol):
+    """Size in bytes of the stored `Key`, e.g. from the `ContentLength` of a HEAD request.
+    None if unknown."""
+
+    def __call__(self, Key: str) -> Optional[int]: ...
+
+
+class Fingerprint(Protocol):
+    """Identify the current content of `Key`, e.g. by bucket, key and ETag.
+    None if unknown."""
+
+    def __call__(self, Key: str) -> Optional[str]: ...
+
+
 INFO_FROM_PATH = Callable[[Path], Dict[str, Any]]
 
+MetricsExporter = Callable[[Dict[str, Any]], None]
+
+HANDLER = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+"Lambda handler, from the event and context to the response"
+
 
 class DownloadError(RuntimeError):
     pass
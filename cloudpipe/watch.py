@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .files import Signature, file_signature
+
+
+class OutputWatcher:
+    """
+    Uploads files matching the wildcard destinations of `fsmap` in the background, while
+    the function is still running.
+
+    A file is uploaded once it is unchanged (size and modification time) between two scans,
+    `interval` seconds apart. Once the function returns, `EventFSMap.save_destn` globs the
+    destinations as usual and only uploads the files which were not uploaded in the background,
+    or which changed since. Objects uploaded in the background whose file was then deleted or
+    renamed are given by `stale`.
+    """
+
+    def __init__(self, fsmap: Any, interval: float):
+        self.fsmap = fsmap
+        self.interval = interval
+        self.keys = [key for key, template in fsmap.destn.items()
+                     if template.is_wild]
+
+        self.seen: Dict[str, Signature] = {}
+        self.uploads: Dict[str, Tuple[Signature, Future]] = {}
+        self.upload_keys: Dict[str, str] = {}
+        "Key of each file uploaded in the background"
+
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, fsmap.max_upload_workers))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "OutputWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self, cancel: bool = False) -> None:
+        """Stop scanning, and wait for the uploads in progress (cancelling those not started if `cancel`)"""
+        self._stop.set()
+        self._thread.join()
+        self._pool.shutdown(wait=True, cancel_futures=cancel)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.scan()
+
+    def scan(self) -> None:
+        for key in self.keys:
+            for _, s3_args in self.fsmap.wildcard_uploads(key):
+                filename = s3_args['Filename']
+                if (signature := file_signature(filename)) is None:
+                    continue
+                if (upload := self.uploads.get(filename)) and upload[0] == signature:
+                    continue
+                if self.seen.get(filename) == signature:
+                    if upload and not upload[1].done():
+                        # changed during its upload, wait for it before uploading again
+                        continue
+                    self.uploads[filename] = (signature, self._pool.submit(
+                        self.fsmap.upload_destn, key, s3_args))
+                    self.upload_keys[filename] = s3_args['Key']
+                    if self.fsmap.metrics:
+                        self.fsmap.metrics.count("background_uploads")
+                self.seen[filename] = signature
+
+    def uploaded(self, s3_args: Dict[str, str]) -> bool:
+        """Whether `s3_args` was uploaded in the background, and is unchanged since"""
+        if not (upload := self.uploads.get(s3_args['Filename'])):
+            return False
+        signature, future = upload
+        return _succeeded(future) and signature == file_signature(s3_args['Filename'])
+
+
+    def stale(self, final_keys: Iterable[str]) -> List[str]:
+        """Keys uploaded in the background which are not among `final_keys`, once stopped"""
+        final_keys = set(final_keys)
+        return sorted(key for filename, key in self.upload_keys.items()
+                      if key not in final_keys and _succeeded(self.uploads[filename][1]))
+
+
+def _succeeded(future: Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None and bool(future.result())
+
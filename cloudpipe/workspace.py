@@ -0,0 +1,146 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+from .cache import DownloadCache
+from .multipart import trim_partials
+
+
+@dataclass
+class Workspace:
+    """
+    Scratch directories for invocations, recycled across invocations of a warm container.
+
+    Each invocation gets an empty directory which is cleaned as soon as it completes.
+    Disk usage (scratch, partial large downloads and download cache) is checked against
+    `disk_budget` before each invocation, evicting cached downloads first, then partial downloads.
+    """
+
+    root: Path = field(default_factory=lambda: Path(
+        tempfile.gettempdir()) / "cloudpipe-work")
+    """Directory under which scratch directories are created"""
+
+    disk_budget: Optional[int] = None
+    """Maximum bytes used by the workspace and its cache, unlimited if None"""
+
+    cache: Optional[DownloadCache] = None
+    """Download cache accounted in (and trimmed to fit) `disk_budget`"""
+
+    keep_cache: bool = True
+    """Keep cached downloads when the workspace is removed at exit"""
+
+    _free: List[Path] = field(default_factory=list, init=False, repr=False)
+    _created: List[Path] = field(default_factory=list, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False)
+    _registered: bool = field(default=False, init=False, repr=False)
+
+    def acquire(self) -> Path:
+        """Empty scratch directory, exclusive to the caller until `release`"""
+
+        with self._lock:
+            if not self._registered:
+                atexit.register(self.cleanup)
+                self._registered = True
+            path = self._free.pop() if self._free else None
+
+        if path is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            path = Path(tempfile.mkdtemp(prefix="run-", dir=self.root))
+            with self._lock:
+                self._created.append(path)
+        else:
+            path.mkdir(parents=True, exist_ok=True)
+
+        self.check_budget()
+        return path
+
+    def release(self, path: Path) -> None:
+        """Remove the contents of scratch directory `path`, to be reused"""
+        self._empty(path)
+        with self._lock:
+            self._free.append(path)
+
+    @contextmanager
+    def scratch(self, fixed: Optional[Union[Path, str]] = None) -> Iterator[Path]:
+        """Scratch directory for a single invocation, or `fixed` (which is left as is) if provided"""
+        if fixed is not None:
+            yield Path(fixed)
+            return
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    @property
+    def partial_dir(self) -> Path:
+        """Partial files of resumable large downloads (see `LargeObjectTransfer`)"""
+        return self.root / "partial"
+
+    def usage(self) -> int:
+        total = _tree_size(self.root)
+        if self.cache and not _is_under(self.cache.root, self.root):
+            total += self.cache.size
+        return total
+
+    def check_budget(self) -> None:
+        if self.disk_budget is None:
+            return
+        usage = self.usage()
+        if usage <= self.disk_budget:
+            return
+        if self.cache:
+            self.cache.trim(max(0, self.cache.size - (usage - self.disk_budget)))
+            usage = self.usage()
+        if usage > self.disk_budget:
+            partial = _tree_size(self.partial_dir)
+            trim_partials(self.partial_dir, size=max(0, partial - (usage - self.disk_budget)))
+            usage = self.usage()
+        if usage > self.disk_budget:
+            warnings.warn(f"Workspace {self.root} uses {usage} bytes, "
+                          f"exceeding the disk budget of {self.disk_budget} bytes")
+
+    def cleanup(self) -> None:
+        with self._lock:
+            created, self._created, self._free = self._created, [], []
+        for path in created:
+            shutil.rmtree(path, ignore_errors=True)
+        if self.cache and not self.keep_cache:
+            self.cache.clear()
+
+    @staticmethod
+    def _empty(path: Path) -> None:
+        if not path.is_dir():
+            return
+        for child in path.iterdir():
+            if child.is_dir() and not child.is_symlink():
+                shutil.rmtree(child, ignore_errors=True)
+            else:
+                child.unlink(missing_ok=True)
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _is_under(path: Path, parent: Path) -> bool:
+    try:
+        Path(path).resolve().relative_to(Path(parent).resolve())
+    except ValueError:
+        return False
+    return True
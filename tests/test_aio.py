@@ -0,0 +1,122 @@
+import asyncio
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from cloudpipe import *
+from cloudpipe.aio import gather_transfers
+from cloudpipe.types import DownloadError
+
+
+class TestAsyncHandler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_aio", latency=0.05)
+        self.storage.clear()
+        for name in "abcdef":
+            self.storage.put(f"in/{name}", name.encode())
+
+        self.cmap = Step(storage=self.storage)
+        self.cmap.local = Path("dummy_path")
+
+        return super().setUp()
+
+    def test(self):
+        @self.cmap(source={name: f"{{doc}}/{name}" for name in "abcdef"},
+                   destn={"out": "{doc}/out.txt"})
+        async def worker(out: Path, **kwargs):
+            await asyncio.sleep(0)
+            out.write_text("".join(kwargs[name].read_text() for name in "abcdef"))
+
+        start = time.perf_counter()
+        response = asyncio.run(worker(
+            {"document": {"name": "aio_doc"},
+             **{name: {"key": f"in/{name}"} for name in "abcdef"}}, None))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(response["body"]["out"], {"key": "out/aio_doc/out.txt"})
+        self.assertEqual(self.storage.get("out/aio_doc/out.txt"), b"abcdef")
+        # downloads overlap: 6 sequential requests would take 0.3s
+        self.assertLess(elapsed, 0.25)
+
+    def test_sync_backend(self):
+        self.cmap.async_downloader = None
+        self.cmap.downloader = MagicMock(
+            side_effect=lambda Key, Filename: Path(Filename).write_text(Key))
+        self.cmap.async_uploader = None
+        self.cmap.uploader = MagicMock()
+
+        @self.cmap(source={"a": "{doc}/a"}, destn={"out": "{doc}/*.txt"})
+        async def worker(a: Path, out: Path, **kwargs):
+            (out / "1.txt").write_text(a.read_text())
+
+        response = asyncio.run(worker(
+            {"document": {"name": "aio_sync_doc"}, "a": {"key": "ka"}}, None))
+
+        self.cmap.downloader.assert_called_once()
+        self.cmap.uploader.assert_called_once()
+        self.assertEqual(response["body"]["out"], [{"out": {"key": "out/aio_sync_doc/1.txt"}}])
+
+    def test_override(self):
+        other = MemoryStorage("test_aio_other")
+        other.put("in/a", b"from-other")
+        self.storage.put("in/a", b"from-main")
+        self.cmap.arg_override_downloader["a"] = other.downloader
+
+        @self.cmap(source={"a": "{doc}/a", "b": "{doc}/b"},
+                   destn={"out": "{doc}/out.txt"})
+        async def worker(a: Path, b: Path, out: Path, **kwargs):
+            out.write_text(a.read_text() + b.read_text())
+
+        asyncio.run(worker({"document": {"name": "aio_override_doc"},
+                            "a": {"key": "in/a"}, "b": {"key": "in/b"}}, None))
+        self.assertEqual(self.storage.get("out/aio_override_doc/out.txt"), b"from-otherb")
+
+    def test_error(self):
+        @self.cmap(source={"a": "{doc}/a", "z": "{doc}/z"})
+        async def worker(**kwargs):
+            raise AssertionError("not reached")
+
+        with self.assertRaisesRegex(DownloadError, "source key z"):
+            asyncio.run(worker({"document": {"name": "dummy_doc"},
+                                "a": {"key": "in/a"}, "z": {"key": "in/missing"}}, None))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            @self.cmap(source={}, batch=True)
+            async def worker(**kwargs):
+                pass
+
+        self.cmap.watch_outputs = 0.1
+        with self.assertRaisesRegex(ValueError, "watch_outputs"):
+            @self.cmap(source={}, destn={"out": "{doc}/*.txt"})
+            async def watched(**kwargs):
+                pass
+
+
+class TestGatherTransfers(unittest.TestCase):
+    def test_cancel(self):
+        finished = []
+
+        async def slow():
+            await asyncio.sleep(1)
+            finished.append(1)
+
+        async def failing():
+            raise DownloadError("failed")
+
+        with self.assertRaises(DownloadError):
+            asyncio.run(gather_transfers([slow, failing, slow]))
+        self.assertEqual(finished, [])
+
+    def test_order(self):
+        async def job(index):
+            await asyncio.sleep((3 - index) * 0.01)
+            return index
+
+        self.assertEqual(asyncio.run(gather_transfers(
+            [lambda i=i: job(i) for i in range(3)], limit=2)), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
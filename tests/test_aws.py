@@ -0,0 +1,179 @@
+import base64
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from pathlib import Path
+
+from cloudpipe import *
+from cloudpipe.multipart import SHA256_METADATA, LargeObjectTransfer
+from cloudpipe.types import DownloadError
+
+
+class TestSharedClient(unittest.TestCase):
+
+    def test(self):
+        first = Step(location_env_key={'s3': 'dummy_bucket'},
+                     arg_override_location_env_key={'other': {'s3': 'other_bucket'}},
+                     transfer_config=dict(max_concurrency=4))
+        second = Step(location_env_key={'s3': 'another_bucket'})
+
+        self.assertIs(first.storage.client, second.storage.client)
+        self.assertIs(first.arg_override_downloader['other'].__self__.client,
+                      first.storage.client)
+        self.assertEqual(first.storage.transfer.max_request_concurrency, 4)
+
+    def test_deferred_import(self):
+        probe = ("import sys, cloudpipe\n"
+                 "step = cloudpipe.Step(location_env_key={'s3': 'dummy_bucket'})\n"
+                 "step(source={'a': '{doc}'})(lambda a, **kwargs: None)\n"
+                 "assert 'boto3' not in sys.modules\n"
+                 "step.storage.client\n"
+                 "assert 'boto3' in sys.modules\n")
+        subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True)
+
+
+class TestListKeys(unittest.TestCase):
+    def test(self):
+        step = Step(location_env_key={'s3': 'dummy_bucket'})
+        client = step.storage.client
+        pages = [{"Contents": [{"Key": "p/0"}, {"Key": "p/1"}]}, {"Contents": [{"Key": "p/2"}]}, {}]
+        with unittest.mock.patch.object(client, "get_paginator") as get_paginator:
+            get_paginator.return_value.paginate.return_value = pages
+            self.assertEqual(list(step.lister(Prefix="p/")), ["p/0", "p/1", "p/2"])
+
+        get_paginator.assert_called_once_with("list_objects_v2")
+        self.assertEqual(get_paginator.return_value.paginate.call_args.kwargs["Prefix"], "p/")
+
+
+class TestContentHash(unittest.TestCase):
+    def test(self):
+        step = Step(location_env_key={'s3': 'dummy_bucket'})
+        client = step.storage.client
+        with unittest.mock.patch.object(client, "upload_file") as upload_file, \
+                unittest.mock.patch.object(client, "head_object") as head_object:
+            step.uploader(Key="k", Filename=__file__, Sha256="ab" * 32)
+            head_object.return_value = {"Metadata": {SHA256_METADATA: "ab" * 32}}
+            self.assertEqual(step.content_hash("k"), "ab" * 32)
+
+        self.assertEqual(upload_file.call_args.kwargs["ExtraArgs"],
+                         {"Metadata": {SHA256_METADATA: "ab" * 32}})
+
+
+class TestContentType(unittest.TestCase):
+    def test(self):
+        step = Step(location_env_key={'s3': 'dummy_bucket'})
+        with unittest.mock.patch.object(step.storage.client, "upload_file") as upload_file:
+            step.uploader(Key="k.gz", Filename=__file__, ContentType="application/gzip")
+
+        self.assertEqual(upload_file.call_args.kwargs["ExtraArgs"], {"ContentType": "application/gzip"})
+
+
+class FakeS3:
+    """Minimal in-memory S3 client for multipart and ranged transfers"""
+
+    def __init__(self):
+        self.objects, self.uploads, self.gets = {}, {}, 0
+        self.fail_after = None
+
+    def head_object(self, Bucket, Key):
+        data, metadata = self.objects[Key]
+        return {"ContentLength": len(data), "ETag": f'"{hash(data)}"', "Metadata": metadata}
+
+    def get_object(self, Bucket, Key, Range, IfMatch=None):
+        if self.fail_after is not None and self.gets >= self.fail_after:
+            raise ConnectionError("connection reset")
+        self.gets += 1
+        start, end = map(int, Range[len("bytes="):].split("-"))
+        return {"Body": io.BytesIO(self.objects[Key][0][start:end + 1])}
+
+    def create_multipart_upload(self, Bucket, Key, ChecksumAlgorithm, Metadata):
+        self.uploads[Key] = ({}, Metadata)
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ChecksumSHA256):
+        assert ChecksumSHA256 == base64.b64encode(hashlib.sha256(Body).digest()).decode()
+        self.uploads[UploadId][0][PartNumber] = Body
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts, metadata = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        self.objects[Key] = (b"".join(parts[n] for n in numbers), metadata)
+
+
+class TestLargeObjects(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = FakeS3()
+        self.transfer = LargeObjectTransfer(client=self.client, bucket="bucket", part_size=10,
+                                            max_workers=1, partial_dir=Path(self.tmp.name) / "partial")
+        self.data = bytes(range(256)) * 2
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test(self):
+        source = Path(self.tmp.name) / "source"
+        source.write_bytes(self.data)
+        self.transfer.upload(Key="big", Filename=str(source))
+        self.assertEqual(self.client.objects["big"][0], self.data)
+
+        destn = Path(self.tmp.name) / "destn"
+        self.client.fail_after = 20
+        with self.assertRaises(ConnectionError):
+            self.transfer.download(Key="big", Filename=str(destn))
+        self.assertFalse(destn.exists())
+
+        self.client.fail_after = None
+        self.transfer.download(Key="big", Filename=str(destn))
+        self.assertEqual(destn.read_bytes(), self.data)
+        # 52 parts, the first 20 were not fetched again
+        self.assertEqual(self.client.gets, 52)
+
+    def test_concurrent(self):
+        self.client.objects["big"] = (self.data, {})
+        destns = [Path(self.tmp.name) / f"destn{index}" for index in range(4)]
+        threads = [threading.Thread(target=self.transfer.download, kwargs=dict(Key="big", Filename=str(destn)))
+                   for destn in destns]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for destn in destns:
+            self.assertEqual(destn.read_bytes(), self.data)
+
+    def test_stale_partials(self):
+        self.client.objects["big"] = (self.data, {})
+        self.client.fail_after = 5
+        with self.assertRaises(ConnectionError):
+            self.transfer.download(Key="big", Filename=str(Path(self.tmp.name) / "destn"))
+        partial_dir = Path(self.tmp.name) / "partial"
+        self.assertEqual(len(list(partial_dir.iterdir())), 2)
+
+        # a new version of the object discards the partial download of the previous one
+        self.client.fail_after = None
+        self.client.objects["big"] = (self.data[::-1], {})
+        self.transfer.download(Key="big", Filename=str(Path(self.tmp.name) / "destn"))
+        self.assertEqual(list(partial_dir.iterdir()), [])
+
+        expired = partial_dir / "expired"
+        expired.write_bytes(b"x")
+        os.utime(expired, (0, 0))
+        self.transfer.download(Key="big", Filename=str(Path(self.tmp.name) / "destn"))
+        self.assertFalse(expired.exists())
+
+    def test_corrupt(self):
+        self.client.objects["big"] = (self.data, {SHA256_METADATA: "0" * 64})
+        with self.assertRaises(DownloadError):
+            self.transfer.download(Key="big", Filename=str(Path(self.tmp.name) / "destn"))
+        self.assertEqual(list((Path(self.tmp.name) / "partial").iterdir()), [])
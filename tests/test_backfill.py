@@ -0,0 +1,73 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+from cloudpipe.backfill import Backfill, events_from_keys
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self.tmp.name)
+        self.storage = LocalStorage("store", root=tmp / "store")
+        for index in range(5):
+            (tmp / "store" / "pages").mkdir(parents=True, exist_ok=True)
+            (tmp / "store" / "pages" / f"p{index}.txt").write_text(f"page {index}")
+
+        self.cmap = Step(storage=self.storage)
+        self.cmap.local = Path("dummy_path")
+
+        @self.cmap(source={"original": "{doc}/page.txt"},
+                   destn={"upper": "{doc}/upper.txt"})
+        def worker(original: Path, upper: Path, **kwargs):
+            upper.write_text(original.read_text().upper())
+
+        self.worker = worker
+        self.output, self.failures = tmp / "results.jsonl", tmp / "failures.jsonl"
+        self.events = list(events_from_keys(self.storage.list_keys, "pages/", "original")) + \
+            [{"document": {"name": "missing"}, "original": {"key": "pages/missing.txt"}}]
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def backfill(self, **kwargs):
+        return Backfill(self.worker, output=self.output, failures=self.failures, workers=2,
+                        report=io.StringIO(), **kwargs)(self.events)
+
+    def test(self):
+        stats = self.backfill()
+        self.assertEqual((stats["processed"], stats["failed"]), (5, 1))
+        self.assertEqual((self.storage.root / "upper" / "p3" / "upper.txt").read_text(), "PAGE 3")
+
+        results = [json.loads(line) for line in self.output.read_text().splitlines()]
+        self.assertEqual(sorted(result["index"] for result in results), list(range(5)))
+        failure = json.loads(self.failures.read_text())
+        self.assertEqual(failure["index"], 5)
+        self.assertIn("DownloadError", failure["error"])
+
+        # resumed
+        stats = self.backfill()
+        self.assertEqual((stats["processed"], stats["failed"], stats["skipped"]), (0, 0, 6))
+
+        stats = self.backfill(retry_failures=True)
+        self.assertEqual((stats["failed"], stats["skipped"]), (1, 5))
+
+    def test_listing_changed(self):
+        self.backfill()
+
+        # an object listed before the others shifts the position of every event
+        (self.storage.root / "pages" / "a.txt").write_text("page a")
+        self.events = list(events_from_keys(self.storage.list_keys, "pages/", "original"))
+        stats = self.backfill()
+        self.assertEqual((stats["processed"], stats["skipped"]), (1, 5))
+        self.assertEqual((self.storage.root / "upper" / "a" / "upper.txt").read_text(), "PAGE A")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from cloudpipe import *
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self) -> None:
+
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         max_batch_workers=3)
+        self.cmap.downloader = MagicMock()
+        self.cmap.uploader = MagicMock()
+
+        @self.cmap(
+            source={"source": "{doc}"},
+            destn={"result": "{doc}.txt"},
+            batch=True)
+        def simple_worker(source: Path, result: Path, *args, **kwargs):
+            if source.name == "bad":
+                raise ValueError("bad document")
+            result.touch()
+
+        self.worker = simple_worker
+
+        return super().setUp()
+
+    def test_sqs(self):
+        records = [
+            {"messageId": f"m{doc}",
+             "body": json.dumps({"document": {"name": doc}, "source": {"key": doc}})}
+            for doc in ("a", "bad", "c")]
+
+        retn = self.worker({"Records": records}, None)
+
+        self.assertEqual(retn["batchItemFailures"], [{"itemIdentifier": "mbad"}])
+        self.assertEqual([x["itemIdentifier"] for x in retn["results"]], ["ma", "mbad", "mc"])
+        self.assertEqual(retn["results"][2]["body"]["result"], {"key": "result/c.txt"})
+        self.assertEqual(self.cmap.downloader.call_count, 3)
+
+    def test_sqs_malformed(self):
+        records = [{"messageId": "ma", "body": json.dumps({"document": {"name": "a"}, "source": {"key": "a"}})},
+                   {"messageId": "mjunk", "body": "not json"}]
+
+        retn = self.worker({"Records": records}, None)
+
+        self.assertEqual(retn["batchItemFailures"], [{"itemIdentifier": "mjunk"}])
+        self.assertEqual(retn["results"][0]["body"]["result"], {"key": "result/a.txt"})
+
+    def test_step_functions(self):
+        retn = self.worker(
+            {"BatchInput": {"run": "1"},
+             "Items": [{"document": {"name": doc}, "source": {"key": doc}} for doc in "xyz"]},
+            None)
+
+        self.assertEqual(retn["batchItemFailures"], [])
+        self.assertEqual([x["body"]["result"]["key"] for x in retn["results"]],
+                         ["result/x.txt", "result/y.txt", "result/z.txt"])
+        self.assertEqual(retn["results"][0]["body"]["run"], "1")
@@ -0,0 +1,69 @@
+import gzip
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_compression")
+        self.storage.clear()
+        self.storage.put("image.jpeg", b"image")
+
+        self.cmap = Step(storage=self.storage, compress={"objects": "gzip", "summary": "gzip"})
+        self.cmap.local = Path("dummy_path")
+
+        @self.cmap(source={"original": "{doc}/image.jpeg"},
+                   destn={"objects": "{doc}/output/*.json", "summary": "{doc}/summary.json"})
+        def produce(objects: Path, summary: Path, **kwargs):
+            for index in range(2):
+                (objects / f"{index}.json").write_text(f'{{"index": {index}}}' * 100)
+            summary.write_text("{}")
+
+        @Step(storage=self.storage, local=Path("dummy_path"))(
+            source={"summary": "{doc}/{file}"}, destn={"copy": "{doc}/copy.json"})
+        def consume(summary: Path, copy: Path, **kwargs):
+            self.assertEqual(summary.name, "summary.json")
+            copy.write_text(summary.read_text())
+
+        self.produce, self.consume = produce, consume
+
+        return super().setUp()
+
+    def test(self):
+        retn = self.produce({"document": {"name": "gz_doc"}, "original": {"key": "image.jpeg"}}, None)
+
+        body = retn["body"]
+        self.assertEqual(body["summary"], {"key": "summary/gz_doc/summary.json.gz", "codec": "gzip"})
+        self.assertEqual([x["objects"] for x in body["objects"]],
+                         [{"key": f"objects/gz_doc/output/{index}.json.gz", "codec": "gzip"}
+                          for index in range(2)])
+        stored = self.storage.get("objects/gz_doc/output/1.json.gz")
+        self.assertLess(len(stored), 100)
+        self.assertEqual(gzip.decompress(stored), b'{"index": 1}' * 100)
+
+        # decompressed by the next step, given the codec in the event
+        self.consume(body, None)
+        self.assertEqual(self.storage.get("copy/gz_doc/copy.json"), b"{}")
+
+    def test_dedup(self):
+        cmap = Step(storage=self.storage, compress={"summary": "gzip"}, dedup_uploads=True)
+        cmap.local = Path("dummy_path")
+
+        @cmap(source={"original": "{doc}/image.jpeg"}, destn={"summary": "{doc}/summary.json"})
+        def produce(summary: Path, **kwargs):
+            summary.write_text("{}")
+
+        event = {"document": {"name": "gz_dedup_doc"}, "original": {"key": "image.jpeg"}}
+        self.assertEqual(produce(event, None)["deduplicated"]["count"], 0)
+        # the digest computed while compressing matches the stored content
+        self.assertEqual(produce(event, None)["deduplicated"]["count"], 1)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            Step(storage=self.storage, compress={"objects": "lz5"})(source={})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestDedupUploads(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_dedup")
+        self.storage.clear()
+        self.storage.put("image.jpeg", b"image")
+        self.collector = MemoryCollector()
+
+        self.cmap = Step(storage=self.storage, dedup_uploads=True, metrics=self.collector)
+        self.cmap.local = Path("dummy_path")
+        self.version = "v1"
+
+        @self.cmap(source={"original": "{doc}/image.jpeg"},
+                   destn={"objects": "{doc}/output/*.jpeg", "summary": "{doc}/summary.txt"})
+        def worker(objects: Path, summary: Path, **kwargs):
+            for index in range(3):
+                (objects / f"{index}.jpeg").write_bytes(b"x" * 100)
+            summary.write_text(self.version)
+
+        self.worker = worker
+
+        return super().setUp()
+
+    def run_worker(self):
+        return self.worker({"document": {"name": "dedup_doc"},
+                            "original": {"key": "image.jpeg"}}, None)
+
+    def test(self):
+        self.assertEqual(self.run_worker()["deduplicated"], dict(count=0, bytes_saved=0))
+
+        self.version = "v2"
+        retn = self.run_worker()
+        self.assertEqual(retn["deduplicated"], dict(count=3, bytes_saved=300))
+        self.assertEqual(self.storage.get("summary/dedup_doc/summary.txt"), b"v2")
+        self.assertEqual(len(retn["body"]["objects"]), 3)
+
+        totals = self.collector.records[-1]["totals"]
+        self.assertEqual((totals["dedup_skipped"], totals["dedup_bytes_saved"]), (3, 300))
+        self.assertEqual(totals["upload_count"], 1)
+
+    def test_streaming(self):
+        cmap = Step(storage=self.storage, dedup_uploads=True, streaming=True)
+        with self.assertRaises(ValueError):
+            @cmap(source={"original": "{doc}/image.jpeg"}, destn={"summary": "{doc}/summary.txt"})
+            def worker(original, summary, **kwargs):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
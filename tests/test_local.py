@@ -0,0 +1,87 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestLocalStorage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = Path(self.tmp.name) / "store"
+        (self.store / "in").mkdir(parents=True)
+        (self.store / "in" / "a.txt").write_text("hello")
+
+        self.cmap = Step(location_env_key={'local': str(self.store)})
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test(self):
+        self.assertIsInstance(self.cmap.storage, LocalStorage)
+
+        @self.cmap(
+            source={"text": "{doc}.txt"},
+            destn={"upper": "{doc}/upper.txt"})
+        def simple_worker(text: Path, upper: Path, *args, **kwargs):
+            upper.write_text(text.read_text().upper())
+
+        retn = simple_worker(
+            event={"document": {"name": "a"}, "text": {"key": "in/a.txt"}},
+            context=None)
+
+        self.assertEqual(retn["body"]["upper"], {"key": "upper/a/upper.txt"})
+        self.assertEqual((self.store / "upper/a/upper.txt").read_text(), "HELLO")
+
+    def test_wild_root(self):
+        (self.store / "b.txt").write_text("world")
+        (self.store / "c.png").write_text("image")
+
+        @self.cmap(
+            source={"texts": "*.txt"},
+            destn={"joined": "{doc}/joined.txt"})
+        def wild_worker(texts: Path, joined: Path, *args, **kwargs):
+            joined.write_text(",".join(path.read_text() for path in sorted(texts.glob("*"))))
+
+        wild_worker(event={"document": {"name": "root"}, "texts": {"key": "*.txt"}}, context=None)
+
+        self.assertEqual((self.store / "joined/root/joined.txt").read_text(), "world")
+        self.assertEqual(list(self.cmap.storage.list_keys("")),
+                         ["b.txt", "c.png", "in/a.txt", "joined/root/joined.txt"])
+
+
+class TestMemoryStorage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_memory", latency=0.05)
+        self.storage.put("in/a.txt", b"hello")
+        self.cmap = Step(storage=self.storage, max_download_workers=4)
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.storage.clear()
+        return super().tearDown()
+
+    def test(self):
+
+        @self.cmap(
+            source={name: f"{{doc}}/{name}.txt" for name in "abcd"},
+            destn={"joined": "{doc}/joined.txt"})
+        def simple_worker(a: Path, b: Path, c: Path, d: Path, joined: Path, *args, **kwargs):
+            joined.write_text("".join(p.read_text() for p in (a, b, c, d)))
+
+        start = time.perf_counter()
+        simple_worker(
+            event={"document": {"name": "x"}, **{name: {"key": "in/a.txt"} for name in "abcd"}},
+            context=None)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(self.storage.get("joined/x/joined.txt"), b"hello" * 4)
+        self.assertEqual(self.storage.requests, 5)
+        # 4 concurrent downloads and one upload
+        self.assertLess(elapsed, 0.05 * 4)
+        self.assertEqual(MemoryStorage("test_memory").get("in/a.txt"), b"hello")
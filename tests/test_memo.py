@@ -0,0 +1,69 @@
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from cloudpipe import *
+
+
+class TestMemoize(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_memo")
+        self.storage.put("in/a.txt", b"hello")
+        self.cmap = Step(storage=self.storage, memoize=True, code_version="1")
+        self.calls = MagicMock()
+
+        @self.cmap(
+            source={"text": "{doc}.txt"},
+            destn={"letters": "{doc}/letters/*"})
+        def simple_worker(text: Path, letters: Path, *args, **kwargs):
+            self.calls()
+            for letter in text.read_text():
+                (letters / letter).write_text(letter)
+
+        self.worker = simple_worker
+        self.event = {"document": {"name": "a"}, "text": {"key": "in/a.txt"}}
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.storage.clear()
+        return super().tearDown()
+
+    def test(self):
+        first = self.worker(self.event, None)
+        again = self.worker(self.event, None)
+
+        self.assertEqual(self.calls.call_count, 1)
+        self.assertTrue(again.pop("memoized"))
+        self.assertEqual(first, again)
+
+    def test_changed(self):
+        self.worker(self.event, None)
+
+        self.storage.put("in/a.txt", b"world")
+        self.worker(self.event, None)
+        self.assertEqual(self.calls.call_count, 2)
+
+        self.cmap.code_version = "2"
+        self.worker(self.event, None)
+        self.assertEqual(self.calls.call_count, 3)
+
+        self.worker(dict(self.event, extra="x"), None)
+        self.assertEqual(self.calls.call_count, 4)
+
+    def test_pages(self):
+        self.storage.put("in/b.txt", b"world")
+        events = [dict(self.event, page={"pagenum": pagenum}, text={"key": key})
+                  for pagenum, key in ((1, "in/a.txt"), (2, "in/b.txt"))]
+
+        for event in events + events:
+            self.worker(event, None)
+        self.assertEqual(self.calls.call_count, 2)
+        self.assertEqual(len([key for key in self.storage.objects if key.startswith("_manifest/")]), 2)
+
+    def test_missing_output(self):
+        first = self.worker(self.event, None)
+        del self.storage.objects[first["body"]["letters"][0]["letters"]["key"]]
+
+        self.assertNotIn("memoized", self.worker(self.event, None))
+        self.assertEqual(self.calls.call_count, 2)
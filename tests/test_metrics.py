@@ -0,0 +1,56 @@
+import contextlib
+import io
+import json
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_metrics")
+        self.storage.put("in/a.txt", b"hello")
+        self.collector = MemoryCollector()
+        self.cmap = Step(storage=self.storage, metrics=self.collector)
+
+        @self.cmap(
+            source={"text": "{doc}.txt"},
+            destn={"upper": "{doc}/upper.txt", "letters": "{doc}/letters/*"})
+        def simple_worker(text: Path, upper: Path, letters: Path, *args, **kwargs):
+            upper.write_text(text.read_text().upper())
+            for letter in "abc":
+                (letters / letter).write_text(letter)
+
+        self.worker = simple_worker
+        self.event = {"document": {"name": "a"}, "text": {"key": "in/a.txt"}}
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.storage.clear()
+        return super().tearDown()
+
+    def test(self):
+        self.worker(self.event, None)
+
+        record, = self.collector.records
+        self.assertEqual(record["function"], "simple_worker")
+        self.assertEqual(set(record["phases"]),
+                         {"download", "execute", "upload", "response"})
+        self.assertEqual(record["totals"]["download_bytes"], 5)
+        self.assertEqual(record["totals"]["upload_count"], 4)
+        self.assertIn(dict(direction="upload", name="upper", key="upper/a/upper.txt", bytes=5),
+                      [{k: v for k, v in t.items() if k != "ms"} for t in record["transfers"]])
+
+    def test_emf(self):
+        self.cmap.metrics = EMFExporter(namespace="test")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.worker(self.event, None)
+
+        line = json.loads(output.getvalue().strip().splitlines()[-1])
+        self.assertEqual(line["_aws"]["CloudWatchMetrics"][0]["Namespace"], "test")
+        self.assertIn({"Name": "upload_bytes", "Unit": "Bytes"},
+                      line["_aws"]["CloudWatchMetrics"][0]["Metrics"])
+        self.assertEqual(line["upload_bytes"], 8)
@@ -0,0 +1,45 @@
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_pipeline")
+        self.storage.clear()
+        self.storage.put("image.jpeg", b"image")
+
+        self.cmap = Step(storage=self.storage)
+        self.cmap.local = Path("dummy_path")
+
+        @self.cmap(source={"original": "{doc}/image.jpeg"},
+                   destn={"text": "{doc}/text.txt", "debug": "{doc}/debug.txt"})
+        def extract(original: Path, text: Path, debug: Path, **kwargs):
+            text.write_text(original.read_text().upper())
+            debug.write_text("debug")
+
+        @self.cmap(source={"text": "{doc}/text.txt"},
+                   destn={"summary": "{doc}/summary.txt"})
+        def summarize(text: Path, summary: Path, **kwargs):
+            summary.write_text(f"summary of {text.read_text()}")
+
+        self.pipeline = Pipeline([extract, summarize], persist=["debug"])
+
+        return super().setUp()
+
+    def test(self):
+        retn = self.pipeline({"document": {"name": "pipe_doc"},
+                              "original": {"key": "image.jpeg"}})
+
+        self.assertEqual(retn["body"]["summary"], {"key": "summary/pipe_doc/summary.txt"})
+        self.assertEqual(self.storage.get("summary/pipe_doc/summary.txt"), b"summary of IMAGE")
+        self.assertEqual(retn["pipeline"], dict(local_downloads=1, skipped_uploads=1))
+
+        # intermediate outputs are only uploaded if persisted
+        self.assertNotIn("text/pipe_doc/text.txt", self.storage.objects)
+        self.assertEqual(self.storage.get("debug/pipe_doc/debug.txt"), b"debug")
+
+
+if __name__ == '__main__':
+    unittest.main()
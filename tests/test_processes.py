@@ -0,0 +1,100 @@
+import os
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+from cloudpipe.processes import run_in_processes
+
+
+class TestMapSource(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_processes")
+        self.storage.clear()
+        for index in range(4):
+            self.storage.put(f"pages/p{index}.png", f"page {index}".encode())
+
+        self.cmap = Step(storage=self.storage, max_map_workers=2)
+        self.cmap.local = Path("dummy_path")
+
+        return super().setUp()
+
+    def test(self):
+        @self.cmap(source={"pages": "{doc}/pages/{file}"},
+                   destn={"crops": "{doc}/crops/*.txt"},
+                   list_copy_keys=["document"], map_source="pages")
+        def worker(pages: Path, crops: Path, crops_args: dict, pages_dpi: int, **kwargs):
+            (crops / f"{pages.stem}.txt").write_text(pages.read_text().upper())
+            crops_args[pages.stem] = dict(pid=os.getpid(), dpi=pages_dpi)
+
+        retn = worker({"document": {"name": "map_doc"},
+                       "pages": [{"key": f"pages/p{index}.png", "dpi": 100 + index}
+                                 for index in range(4)]}, None)
+
+        crops = retn["body"]["crops"]
+        self.assertEqual([x["crops"]["key"] for x in crops],
+                         [f"crops/map_doc/crops/p{index}.txt" for index in range(4)])
+        self.assertEqual(self.storage.get("crops/map_doc/crops/p2.txt"), b"PAGE 2")
+
+        # args of every call are merged
+        merged = crops[0]["crops"]
+        self.assertEqual([merged[f"p{index}"]["dpi"] for index in range(4)], [100, 101, 102, 103])
+        self.assertNotIn(os.getpid(), {merged[f"p{index}"]["pid"] for index in range(4)})
+
+    def test_wild_source(self):
+        @self.cmap(source={"pages": "{doc}/pages/*.png"},
+                   destn={"crops": "{doc}/crops/*.txt"}, map_source="pages")
+        def worker(pages: Path, crops: Path, **kwargs):
+            (crops / f"{pages.stem}.txt").write_text(pages.read_text().upper())
+
+        retn = worker({"document": {"name": "map_wild_doc"}, "pages": {"prefix": "pages"}}, None)
+
+        self.assertEqual([x["crops"]["key"] for x in retn["body"]["crops"]],
+                         [f"crops/map_wild_doc/crops/p{index}.txt" for index in range(4)])
+        self.assertEqual(self.storage.get("crops/map_wild_doc/crops/p3.txt"), b"PAGE 3")
+
+    def test_single_destn(self):
+        with self.assertRaises(ValueError):
+            @self.cmap(source={"pages": "{doc}/pages/{file}"},
+                       destn={"summary": "{doc}/summary.json"},
+                       map_source="pages")
+            def worker(**kwargs):
+                pass
+
+    def test_path_without_file(self):
+        with self.assertRaisesRegex(ValueError, "{file}"):
+            @self.cmap(source={"pages": "{doc}/pages/page.png"}, map_source="pages")
+            def worker(**kwargs):
+                pass
+
+    def test_single_object(self):
+        @self.cmap(source={"pages": "{doc}/pages/{file}"}, map_source="pages")
+        def worker(**kwargs):
+            pass
+
+        with self.assertRaisesRegex(ValueError, "list"):
+            worker({"document": {"name": "map_doc"}, "pages": {"key": "pages/p0.png"}}, None)
+
+    def test_options(self):
+        for option in ("streaming", "lazy_sources"):
+            cmap = Step(storage=self.storage, **{option: True})
+            with self.assertRaisesRegex(ValueError, option):
+                cmap(source={"pages": "{doc}/pages/{file}"}, destn={"crops": "{doc}/crops/*.txt"},
+                     map_source="pages")
+
+
+def fail():
+    raise KeyError("failed")
+
+
+class TestRunInProcesses(unittest.TestCase):
+    def test_order(self):
+        self.assertEqual(run_in_processes([lambda i=i: i * i for i in range(5)], max_workers=3),
+                         [0, 1, 4, 9, 16])
+
+    def test_error(self):
+        with self.assertRaises(KeyError):
+            run_in_processes([lambda: 1, fail, lambda: 2], max_workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
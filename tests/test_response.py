@@ -0,0 +1,72 @@
+import json
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+from cloudpipe.main import payload_size, return_body
+
+
+class TestReturnBody(unittest.TestCase):
+    def test(self):
+        event = {"document": {"name": "doc"}, "original": {"key": "image.jpeg"}}
+        remotemap = {"_return": {"objects": ["objects/doc/0.jpeg", "objects/doc/1.jpeg"],
+                                 "summary": {"key": "summary/doc/summary.json"}}}
+
+        body = return_body(event, remotemap, list_keys=["objects"],
+                           extra_return={"objects": {"dpi": 300}, "summary": {"pages": 2}},
+                           key_copy=["document"])
+
+        self.assertEqual(body["summary"], {"key": "summary/doc/summary.json", "pages": 2})
+        self.assertEqual(body["objects"], [
+            {"objects": {"key": "objects/doc/0.jpeg", "dpi": 300}, "document": {"name": "doc"}},
+            {"objects": {"key": "objects/doc/1.jpeg", "dpi": 300}, "document": {"name": "doc"}}])
+        # the event itself is left unchanged
+        self.assertNotIn("objects", event)
+
+
+class TestSpillLists(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_response")
+        self.storage.clear()
+        self.storage.put("image.jpeg", b"image")
+        self.collector = MemoryCollector()
+
+        self.cmap = Step(storage=self.storage, spill_lists=1024, save_prefix="run",
+                         metrics=self.collector)
+        self.cmap.local = Path("dummy_path")
+
+        return super().setUp()
+
+    def run_worker(self, count: int):
+        @self.cmap(source={"original": "{doc}/image.jpeg"},
+                   destn={"objects": "{doc}/output/*.jpeg"},
+                   list_copy_keys=["document"])
+        def worker(objects: Path, **kwargs):
+            for index in range(count):
+                (objects / f"{index:03}.jpeg").write_bytes(b"x")
+
+        return worker({"document": {"name": f"spill_doc_{count}"},
+                       "original": {"key": "image.jpeg"}}, None)
+
+    def test(self):
+        retn = self.run_worker(100)
+
+        manifest = retn["body"]["objects"]["manifest"]
+        self.assertEqual(manifest, {"key": "run/_manifest/worker/spill_doc_100/objects.jsonl",
+                                    "count": 100})
+        lines = self.storage.get(manifest["key"]).decode().splitlines()
+        self.assertEqual(json.loads(lines[1]),
+                         {"objects": {"key": "run/objects/spill_doc_100/output/001.jpeg"},
+                          "document": {"name": "spill_doc_100"}})
+
+        response_bytes = self.collector.records[-1]["totals"]["response_bytes"]
+        self.assertEqual(response_bytes, payload_size(retn["body"]))
+        self.assertLess(response_bytes, 1024)
+
+    def test_small(self):
+        retn = self.run_worker(2)
+        self.assertEqual(len(retn["body"]["objects"]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from cloudpipe import *
+from cloudpipe.retry import is_transient
+from cloudpipe.types import DownloadError
+
+
+class SlowDown(Exception):
+    response = {"Error": {"Code": "SlowDown"}, "ResponseMetadata": {"HTTPStatusCode": 503}}
+
+
+class TestRetry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         retry=RetryPolicy(base_delay=0.001))
+        self.cmap.local = Path("dummy_path")
+        self.cmap.uploader = MagicMock()
+
+        @self.cmap(source={"a": "{doc}/a"})
+        def worker(a: Path, **kwargs):
+            pass
+
+        self.worker = worker
+        self.event = {"document": {"name": "retry_doc"}, "a": {"key": "ka"}}
+
+        return super().setUp()
+
+    def test(self):
+        self.cmap.downloader = MagicMock(side_effect=[SlowDown(), SlowDown(), None])
+
+        retn = self.worker(self.event, None)
+        self.assertEqual(self.cmap.downloader.call_count, 3)
+        self.assertEqual(retn["retries"]["download_retries"], 2)
+
+    def test_not_transient(self):
+        self.cmap.downloader = MagicMock(side_effect=DownloadError("not found"))
+
+        with self.assertRaises(DownloadError):
+            self.worker(self.event, None)
+        self.assertEqual(self.cmap.downloader.call_count, 1)
+
+    def test_deadline(self):
+        self.cmap.downloader = MagicMock(side_effect=SlowDown())
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 500
+
+        with self.assertRaises(SlowDown):
+            self.worker(self.event, context)
+        self.assertEqual(self.cmap.downloader.call_count, 1)
+
+    def test_stalled(self):
+        release = threading.Event()
+        self.cmap.downloader = MagicMock(side_effect=lambda **kwargs: release.wait(5))
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 1100
+
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.worker(self.event, context)
+        self.assertLess(time.monotonic() - start, 1)
+        release.set()
+
+    def test_transient(self):
+        self.assertTrue(is_transient(SlowDown()))
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertFalse(is_transient(DownloadError("not found")))
+
+
+class TestHedge(unittest.TestCase):
+    def test(self):
+        policy = RetryPolicy(hedge_quantile=0.5, hedge_min_samples=1)
+        policy.observe(0.01)
+        calls = []
+        release = threading.Event()
+
+        def downloader(Key, Filename):
+            calls.append(Filename)
+            if len(calls) == 1:
+                # stalled request
+                release.wait(5)
+            Path(Filename).write_text(f"attempt {len(calls)}")
+
+        transfers = policy.start()
+        path = Path("dummy_path") / "hedge.txt"
+        path.parent.mkdir(exist_ok=True)
+
+        start = time.monotonic()
+        transfers.downloader(downloader)(Key="k", Filename=str(path))
+        self.assertLess(time.monotonic() - start, 1)
+
+        self.assertEqual(path.read_text(), "attempt 2")
+        self.assertEqual(transfers.counts["hedged"], 1)
+        self.assertEqual(transfers.counts["hedge_wins"], 1)
+
+        release.set()
+
+    def test_max_bytes(self):
+        policy = RetryPolicy(hedge_quantile=0.5, hedge_min_samples=1, hedge_max_bytes=4)
+        policy.observe(0.001)
+        calls = []
+
+        def downloader(Key, Filename):
+            calls.append(Filename)
+            time.sleep(0.05)
+            Path(Filename).write_text("large")
+
+        transfers = policy.start()
+        path = Path("dummy_path") / "hedge_large.txt"
+        path.parent.mkdir(exist_ok=True)
+
+        transfers.downloader(downloader, object_size=lambda Key: 5)(Key="k", Filename=str(path))
+        self.assertEqual(calls, [str(path)])
+        self.assertEqual(transfers.counts["hedged"], 0)
+
+    def test_failed_part(self):
+        policy = RetryPolicy(hedge_quantile=0.5, hedge_min_samples=1)
+        policy.observe(0.01)
+        calls = []
+        release, failed = threading.Event(), threading.Event()
+
+        def downloader(Key, Filename):
+            calls.append(Filename)
+            Path(Filename).write_text("partial")
+            if len(calls) == 1:
+                release.wait(5)
+                failed.set()
+                raise ConnectionResetError()
+            Path(Filename).write_text("complete")
+
+        transfers = policy.start(max_workers=2)
+        directory = Path("dummy_path") / "hedge_parts"
+        directory.mkdir(parents=True, exist_ok=True)
+
+        transfers.downloader(downloader)(Key="k", Filename=str(directory / "a.txt"))
+        release.set()
+        failed.wait(5)
+        time.sleep(0.05)
+
+        self.assertEqual([path.name for path in directory.iterdir()], ["a.txt"])
+        self.assertEqual((directory / "a.txt").read_text(), "complete")
+
+
+if __name__ == '__main__':
+    unittest.main()
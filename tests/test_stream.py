@@ -0,0 +1,148 @@
+import io
+import unittest
+from typing import BinaryIO
+from unittest.mock import MagicMock
+
+from cloudpipe import *
+from cloudpipe.aws import MultipartWriter, RangedReader
+
+
+class Committed(io.BytesIO):
+    def __init__(self, store, key):
+        super().__init__()
+        self.store, self.key = store, key
+
+    def close(self):
+        self.store[self.key] = self.getvalue()
+        super().close()
+
+    def abort(self):
+        super().close()
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self) -> None:
+        self.objects = {"in/a.txt": b"hello"}
+
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'}, streaming=True)
+        self.cmap.downloader = MagicMock()
+        self.cmap.uploader = MagicMock()
+        self.cmap.stream_downloader = lambda Key: io.BytesIO(self.objects[Key])
+        self.cmap.stream_uploader = lambda Key: Committed(self.objects, Key)
+
+        return super().setUp()
+
+    def test(self):
+
+        @self.cmap(
+            source={"text": "{doc}.txt"},
+            destn={"upper": "{doc}/upper.txt"})
+        def simple_worker(text: BinaryIO, upper: BinaryIO, *args, **kwargs):
+            upper.write(text.read().upper())
+
+        retn = simple_worker(
+            event={"document": {"name": "dummy_doc"}, "text": {"key": "in/a.txt"}},
+            context=None)
+
+        self.cmap.downloader.assert_not_called()
+        self.cmap.uploader.assert_not_called()
+        self.assertEqual(retn["body"]["upper"], {"key": "upper/dummy_doc/upper.txt"})
+        self.assertEqual(self.objects["upper/dummy_doc/upper.txt"], b"HELLO")
+
+    def test_error(self):
+
+        @self.cmap(
+            source={"text": "{doc}.txt"},
+            destn={"upper": "{doc}/upper.txt"})
+        def simple_worker(upper: BinaryIO, *args, **kwargs):
+            upper.write(b"partial")
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            simple_worker(
+                event={"document": {"name": "dummy_doc"}, "text": {"key": "in/a.txt"}},
+                context=None)
+        self.assertNotIn("upper/dummy_doc/upper.txt", self.objects)
+
+    def test_close_error(self):
+        aborted = []
+
+        class Failing(Committed):
+            def close(self):
+                raise ConnectionError()
+
+        class Tracked(Committed):
+            def abort(self):
+                aborted.append(self.key)
+                super().abort()
+
+        self.cmap.stream_uploader = lambda Key: (Failing if "first" in Key else Tracked)(self.objects, Key)
+
+        @self.cmap(
+            source={"text": "{doc}.txt"},
+            destn={"first": "{doc}/first.txt", "second": "{doc}/second.txt"})
+        def simple_worker(first: BinaryIO, second: BinaryIO, *args, **kwargs):
+            first.write(b"1")
+            second.write(b"2")
+
+        with self.assertRaises(ConnectionError):
+            simple_worker(
+                event={"document": {"name": "dummy_doc"}, "text": {"key": "in/a.txt"}},
+                context=None)
+        self.assertEqual(aborted, ["second/dummy_doc/second.txt"])
+        self.assertNotIn("second/dummy_doc/second.txt", self.objects)
+
+    def test_list_source(self):
+        @self.cmap(source={"text": "{doc}/{file}"}, destn={"upper": "{doc}/upper.txt"})
+        def simple_worker(*args, **kwargs):
+            pass
+
+        with self.assertRaisesRegex(ValueError, "List sources"):
+            simple_worker(
+                event={"document": {"name": "dummy_doc"}, "text": [{"key": "in/a.txt"}]},
+                context=None)
+
+    def test_wildcard(self):
+        with self.assertRaises(ValueError):
+            self.cmap(source={}, destn={"crops": "{doc}/*.jpeg"})
+
+
+class TestS3Streams(unittest.TestCase):
+
+    def test_reader(self):
+        data = bytes(range(256)) * 10
+        client = MagicMock()
+        client.head_object.return_value = {"ContentLength": len(data)}
+
+        def get_object(Bucket, Key, Range):
+            start, end = map(int, Range[len("bytes="):].split("-"))
+            return {"Body": io.BytesIO(data[start:end + 1])}
+
+        client.get_object.side_effect = get_object
+
+        reader = io.BufferedReader(RangedReader(client, "bucket", "key"), buffer_size=1000)
+        reader.seek(100)
+        self.assertEqual(reader.read(10), data[100:110])
+        reader.seek(0)
+        self.assertEqual(reader.read(), data)
+        self.assertEqual(client.get_object.call_count, 2)
+
+    def test_writer(self):
+        client = MagicMock()
+        client.create_multipart_upload.return_value = {"UploadId": "u"}
+        client.upload_part.return_value = {"ETag": "e"}
+
+        writer = MultipartWriter(client, "bucket", "key", part_size=4)
+        writer.write(b"0123456789")
+        writer.close()
+
+        self.assertEqual([c.kwargs["Body"] for c in client.upload_part.call_args_list],
+                         [b"0123", b"4567", b"89"])
+        client.complete_multipart_upload.assert_called_once()
+        client.put_object.assert_not_called()
+
+        small = MultipartWriter(client, "bucket", "small", part_size=4)
+        small.write(b"01")
+        small.close()
+        client.put_object.assert_called_once_with(Bucket="bucket", Key="small", Body=b"01")
+
@@ -0,0 +1,28 @@
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+from cloudpipe.main import wild_path_parent
+from cloudpipe.template import PathTemplate
+
+
+class TestPathTemplate(unittest.TestCase):
+
+    def test(self):
+        template = PathTemplate("{doc}/pages/{pagenum}/*.jpeg")
+        self.assertEqual(template.names, ("doc", "pagenum"))
+        self.assertTrue(template.is_wild)
+        self.assertEqual(template.render(dict(doc="d", pagenum="3", file="x")),
+                         "d/pages/3/*.jpeg")
+        self.assertEqual(wild_path_parent(template.render(dict(doc="d", pagenum="3"))),
+                         Path("d/pages/3"))
+        self.assertFalse(PathTemplate("{doc}/{file}").is_wild)
+        self.assertEqual(PathTemplate("{doc!r:>5}").render(dict(doc="d")), "  'd'")
+
+    def test_unknown_name(self):
+        with self.assertRaisesRegex(ValueError, "{document}"):
+            PathTemplate("{document}/x")
+
+        cmap = Step(location_env_key={'s3': 'dummy_bucket'})
+        with self.assertRaises(ValueError):
+            cmap(source={"upload": "{doc}/{fil}"})
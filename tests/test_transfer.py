@@ -0,0 +1,198 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from cloudpipe import *
+from cloudpipe.types import DownloadError
+
+
+class TestConcurrentDownload(unittest.TestCase):
+    def setUp(self) -> None:
+
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         max_download_workers=4)
+        self.cmap.local = Path("dummy_path")
+        self.cmap.uploader = MagicMock()
+
+        return super().setUp()
+
+    def test(self):
+        barrier = threading.Barrier(3, timeout=5)
+        self.cmap.downloader = MagicMock(side_effect=lambda **_: barrier.wait())
+
+        @self.cmap(
+            source={"a": "{doc}/a", "b": "{doc}/b", "c": "{doc}/c"})
+        def simple_worker(a: Path, b: Path, c: Path, *args, **kwargs):
+            self.assertEqual(c, Path("dummy_path") / "dummy_doc" / "c")
+
+        simple_worker(
+            event={"document": {"name": "dummy_doc"},
+                   "a": {"key": "ka"}, "b": {"key": "kb"}, "c": {"key": "kc"}},
+            context=None)
+
+        self.assertEqual(self.cmap.downloader.call_count, 3)
+
+    def test_error(self):
+        def failing(Key, Filename):
+            if Key == "kb":
+                raise DownloadError("not found")
+
+        self.cmap.downloader = failing
+
+        @self.cmap(source={"a": "{doc}/a", "b": "{doc}/b"})
+        def simple_worker(*args, **kwargs):
+            self.fail("Should not be called")
+
+        with self.assertRaisesRegex(DownloadError, "source key b: .*:: not found"):
+            simple_worker(
+                event={"document": {"name": "dummy_doc"},
+                       "a": {"key": "ka"}, "b": {"key": "kb"}},
+                context=None)
+
+
+class TestConcurrentUpload(unittest.TestCase):
+    def setUp(self) -> None:
+
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         max_upload_workers=4)
+        self.cmap.local = Path("dummy_path")
+        self.cmap.downloader = MagicMock()
+        self.cmap.uploader = MagicMock()
+
+        return super().setUp()
+
+    def test(self):
+
+        @self.cmap(
+            source={"original": "{doc}/input.jpeg"},
+            destn={"objects": "{doc}/crops/*.jpeg", "summary": "{doc}/summary.json"})
+        def simple_worker(objects: Path, summary: Path, *args, **kwargs):
+            for i in reversed(range(12)):
+                (objects / f"{i:02d}.jpeg").touch()
+            summary.touch()
+
+        retn = simple_worker(
+            event={"document": {"name": "dummy_doc"},
+                   "original": {"key": "image.jpeg"}},
+            context=None)
+
+        self.assertEqual(self.cmap.uploader.call_count, 13)
+        up_keys = [x["objects"]["key"] for x in retn["body"]["objects"]]
+        self.assertEqual(
+            up_keys, [f"objects/dummy_doc/crops/{i:02d}.jpeg" for i in range(12)])
+        self.assertEqual(retn["body"]["summary"],
+                         {"key": "summary/dummy_doc/summary.json"})
+
+    def test_ignore_missing(self):
+        def uploader(Key, Filename):
+            if not Path(Filename).exists():
+                raise FileNotFoundError(Filename)
+
+        self.cmap.uploader = MagicMock(side_effect=uploader)
+
+        @self.cmap(
+            source={"original": "{doc}/input.jpeg"},
+            destn={"optional": "{doc}/optional.json",
+                   "summary": "{doc}/summary.json"},
+            ignore_missing_destn=["optional"])
+        def simple_worker(summary: Path, *args, **kwargs):
+            summary.touch()
+
+        retn = simple_worker(
+            event={"document": {"name": "dummy_doc"},
+                   "original": {"key": "image.jpeg"}},
+            context=None)
+
+        self.assertNotIn("optional", retn["body"])
+        self.assertIn("summary", retn["body"])
+
+
+class TestDownloadCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         download_cache=DownloadCache(root=self.cache_dir.name))
+        self.cmap.fingerprint = lambda Key: f"bucket/{Key}@etag"
+        self.cmap.uploader = MagicMock()
+
+        def downloader(Key, Filename):
+            Path(Filename).write_text(Key)
+
+        self.cmap.downloader = MagicMock(side_effect=downloader)
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+        return super().tearDown()
+
+    def test(self):
+
+        @self.cmap(source={"model": "{doc}/model.bin"})
+        def simple_worker(model: Path, *args, **kwargs):
+            self.assertEqual(model.read_text(), "models/v1.bin")
+
+        for doc in ("a", "b", "c"):
+            simple_worker(
+                event={"document": {"name": doc},
+                       "model": {"key": "models/v1.bin"}},
+                context=None)
+
+        self.assertEqual(self.cmap.downloader.call_count, 1)
+        self.assertEqual((self.cmap.cache_hits, self.cmap.cache_misses), (2, 1))
+
+    def test_modified(self):
+
+        @self.cmap(source={"model": "{doc}/model.bin"})
+        def simple_worker(model: Path, *args, **kwargs):
+            model.write_text("changed in place")
+
+        for doc in ("a", "b"):
+            simple_worker(
+                event={"document": {"name": doc},
+                       "model": {"key": "models/v1.bin"}},
+                context=None)
+
+        self.assertEqual(self.cmap.cache_misses, 2)
+
+    def test_evict(self):
+        cache = DownloadCache(root=self.cache_dir.name, max_bytes=20)
+        for key in ("0123456789", "abcdefghij", "klmnopqrst"):
+            cache.fetch(self.cmap.downloader, self.cmap.fingerprint,
+                        Key=key, Filename=str(Path(self.cache_dir.name) / "out"))
+        self.assertLessEqual(cache.size, 20)
+        self.assertEqual(len(cache._entries), 2)
+
+
+class TestLazyDownload(unittest.TestCase):
+    def setUp(self) -> None:
+
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         lazy_sources=True)
+        self.cmap.uploader = MagicMock()
+
+        def downloader(Key, Filename):
+            Path(Filename).write_text(Key)
+
+        self.cmap.downloader = MagicMock(side_effect=downloader)
+
+        return super().setUp()
+
+    def test(self):
+
+        @self.cmap(source={"image": "{doc}/image.jpeg", "fallback": "{doc}/fallback.jpeg"})
+        def simple_worker(image: Path, fallback: Path, *args, **kwargs):
+            self.assertEqual(fallback.name, "fallback.jpeg")
+            self.assertEqual(image.read_text(), "in/image.jpeg")
+            with open(image) as fp:
+                self.assertEqual(fp.read(), "in/image.jpeg")
+
+        retn = simple_worker(
+            event={"document": {"name": "dummy_doc"},
+                   "image": {"key": "in/image.jpeg"}, "fallback": {"key": "in/fallback.jpeg"}},
+            context=None)
+
+        self.cmap.downloader.assert_called_once()
+        self.assertEqual(retn["fetched"], ["image"])
@@ -0,0 +1,63 @@
+import time
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestWatchOutputs(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_watch")
+        self.storage.clear()
+        self.storage.put("image.jpeg", b"image")
+
+        self.cmap = Step(storage=self.storage, watch_outputs=0.02)
+        self.cmap.local = Path("dummy_path")
+
+        return super().setUp()
+
+    def test(self):
+        uploaded_while_running = []
+
+        @self.cmap(source={"original": "{doc}/image.jpeg"},
+                   destn={"objects": "{doc}/output/*.jpeg"})
+        def worker(objects: Path, **kwargs):
+            (objects / "0.jpeg").write_bytes(b"0")
+            (objects / "1.jpeg").write_bytes(b"draft")
+            time.sleep(0.2)
+            uploaded_while_running.extend(sorted(self.storage.objects))
+
+            (objects / "1.jpeg").write_bytes(b"final")
+            (objects / "2.jpeg").write_bytes(b"2")
+
+        retn = worker({"document": {"name": "watch_doc"},
+                       "original": {"key": "image.jpeg"}}, None)
+
+        prefix = "objects/watch_doc/output"
+        self.assertIn(f"{prefix}/0.jpeg", uploaded_while_running)
+        self.assertEqual([x["objects"]["key"] for x in retn["body"]["objects"]],
+                         [f"{prefix}/{index}.jpeg" for index in range(3)])
+        # changed after its background upload
+        self.assertEqual(self.storage.get(f"{prefix}/1.jpeg"), b"final")
+        self.assertEqual(self.storage.get(f"{prefix}/2.jpeg"), b"2")
+
+    def test_deleted(self):
+        @self.cmap(source={"original": "{doc}/image.jpeg"},
+                   destn={"objects": "{doc}/output/*"})
+        def worker(objects: Path, **kwargs):
+            (objects / "0.jpeg").write_bytes(b"0")
+            (objects / "scratch.tmp").write_bytes(b"tmp")
+            time.sleep(0.2)
+            (objects / "scratch.tmp").unlink()
+
+        retn = worker({"document": {"name": "watch_deleted_doc"},
+                       "original": {"key": "image.jpeg"}}, None)
+
+        prefix = "objects/watch_deleted_doc/output"
+        self.assertEqual([x["objects"]["key"] for x in retn["body"]["objects"]], [f"{prefix}/0.jpeg"])
+        self.assertNotIn(f"{prefix}/scratch.tmp", self.storage.objects)
+        self.assertIn(f"{prefix}/0.jpeg", self.storage.objects)
+
+
+if __name__ == '__main__':
+    unittest.main()
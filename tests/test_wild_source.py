@@ -0,0 +1,45 @@
+import unittest
+from pathlib import Path
+
+from cloudpipe import *
+
+
+class TestWildcardSource(unittest.TestCase):
+    def setUp(self) -> None:
+        self.storage = MemoryStorage("test_wild_source")
+        self.storage.clear()
+        for index in range(5):
+            self.storage.put(f"objects/doc/output/{index}.jpeg", f"{index}".encode())
+        self.storage.put("objects/doc/output/notes.txt", b"notes")
+        self.storage.put("objects/doc/output/sub/5.jpeg", b"5")
+
+        self.cmap = Step(storage=self.storage, max_download_workers=4)
+        self.cmap.local = Path("dummy_path")
+
+        @self.cmap(source={"objects": "{doc}/input/*.jpeg"},
+                   destn={"summary": "{doc}/summary.txt"})
+        def worker(objects: Path, summary: Path, **kwargs):
+            summary.write_text(",".join(path.read_text() for path in sorted(objects.glob("*"))))
+
+        self.worker = worker
+
+        return super().setUp()
+
+    def test_prefix(self):
+        self.worker({"document": {"name": "wild_doc"},
+                     "objects": {"prefix": "objects/doc/output"}}, None)
+        self.assertEqual(self.storage.get("summary/wild_doc/summary.txt"), b"0,1,2,3,4")
+
+    def test_key(self):
+        self.worker({"document": {"name": "wild_key_doc"},
+                     "objects": {"key": "objects/doc/output/*.txt"}}, None)
+        self.assertEqual(self.storage.get("summary/wild_key_doc/summary.txt"), b"notes")
+
+    def test_exact_key(self):
+        with self.assertRaises(ValueError):
+            self.worker({"document": {"name": "wild_doc"},
+                         "objects": {"key": "objects/doc/output/1.jpeg"}}, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
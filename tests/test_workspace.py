@@ -0,0 +1,81 @@
+import atexit
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from cloudpipe import *
+from cloudpipe.workspace import Workspace
+
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+
+        self.cmap = Step(location_env_key={'s3': 'dummy_bucket'},
+                         workspace=Workspace(root=Path(self.tmp.name) / "work"))
+        self.cmap.downloader = MagicMock()
+        self.cmap.uploader = MagicMock()
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test(self):
+        roots = []
+
+        @self.cmap(
+            source={"source": "{doc}"},
+            destn={"result": "{doc}/result.txt"})
+        def simple_worker(source: Path, result: Path, *args, **kwargs):
+            self.assertFalse(result.exists())
+            result.write_text("x" * 100)
+            roots.append(result.parents[1])
+
+        with patch.object(atexit, "register", wraps=atexit.register) as register:
+            for doc in range(5):
+                simple_worker(
+                    event={"document": {"name": str(doc)}, "source": {"key": "a"}},
+                    context=None)
+
+        self.assertEqual(register.call_count, 1)
+        self.assertEqual(len(set(roots)), 1)
+        self.assertEqual(list(roots[0].iterdir()), [])
+
+        self.cmap.workspace.cleanup()
+        self.assertFalse(roots[0].exists())
+
+    def test_budget(self):
+        cache = DownloadCache(root=Path(self.tmp.name) / "cache")
+        workspace = Workspace(root=Path(self.tmp.name) / "work",
+                              cache=cache, disk_budget=50)
+
+        def downloader(Key, Filename):
+            Path(Filename).write_text("x" * 40)
+
+        for key in ("a", "b"):
+            cache.fetch(downloader, lambda Key: Key, Key=key,
+                        Filename=str(Path(self.tmp.name) / key))
+        self.assertEqual(cache.size, 80)
+
+        with workspace.scratch():
+            self.assertLessEqual(cache.size, 50)
+
+    def test_budget_partials(self):
+        workspace = Workspace(root=Path(self.tmp.name) / "work", disk_budget=50)
+        workspace.partial_dir.mkdir(parents=True)
+        for name in ("old", "new"):
+            (workspace.partial_dir / name).write_text("x" * 40)
+            (workspace.partial_dir / f"{name}.json").write_text("{}")
+
+        with workspace.scratch():
+            self.assertLessEqual(workspace.usage(), 50)
+        self.assertEqual(sorted(path.name for path in workspace.partial_dir.iterdir()), ["new", "new.json"])
+
+    def test_partial_dir(self):
+        step = Step(location_env_key={'s3': 'dummy_bucket'}, workspace=self.cmap.workspace,
+                    large_objects=dict(threshold=100))
+        self.assertEqual(step.storage.large.partial_dir, self.cmap.workspace.partial_dir)
+